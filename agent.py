@@ -6,70 +6,88 @@ https://github.com/patrickloeber/snake-ai-pytorch
 '''
 
 import torch
-import random
+import contextlib
 import numpy as np
-from collections import deque  # data structure where we want to store our memory
-from hide_seek import Game, screen, LIME
-from model import Linear_QNet, QTrainer
-from plot_helper import plot_rewards, plot_interaction, save_to_csv, save_dict_to_csv
+import profiling
+from hide_seek import Game, LIME, STATE_SIZE
+from model import Linear_QNet, QTrainer, to_tensor, stacked_forward
+from replay_buffer import BUFFERS
+from checkpoint import CheckpointManager, load_snapshot, restore_snapshot
+from learner import Learner
+from prefetch import BatchPrefetcher
+from plot_helper import plot_rewards, plot_interaction, MetricsWriter, BackgroundPlotter
 
 MAX_MEMORY = 100_000
+MEMMAP_FOLDER = None  # Folder to keep the replay memories in files instead of RAM, for a MAX_MEMORY bigger than RAM
+COMPACT_MEMORY = False  # Keep the replay memories bit packed, 13 bytes per transition
 BATCH_SIZE = 1000
 LR = 0.001
+SAVE_EVERY = 1  # Save the models every this many games (None to only keep the best ones)
+KEEP_RECENT = 3  # Versioned checkpoints kept of the latest saves
+KEEP_BEST = 3  # and of the latest improvements of the best team rewards
+SNAPSHOT_EVERY = 50  # Save the full training state to resume from every this many games (None for never)
 
 SITUATED = True
 INTRINSIC = False
+RENDER = True  # Set to False to train headless, without a window and the 100 FPS cap
+PRIORITIZED = False  # Sample the experience replay by TD error instead of uniformly
+BACKGROUND_PLOT = False  # Plot the rewards to a PNG in pandas_plots from another process instead of the blocking window
+RESUME = False  # Continue from the latest snapshot of the run instead of starting over
+ASYNC_LEARNER = False  # Train on a learner thread from the replay memories, the game doesn't wait for the updates
+REPLAY_RATIO = 0.25  # Updates of every agent per tick with the learner thread
+PUBLISH_EVERY = 50  # Updates between handing the new weights to the players
+LEARNER_BATCH_SIZE = 64
+PREFETCH_BATCHES = 0  # Replay batches every agent samples ahead on a thread with the async learner (0 for none)
 
 class Agent:
 
-    def __init__(self):
+    def __init__(self, prioritized=False):
         self.n_games = 0  # keep track of games
         self.epsilon = 0  # control the randomness # If you are loading a model, please adjust this to something smaller
         self.gamma = 0.9  # discount rate
-        self.memory = deque(maxlen=MAX_MEMORY) # If we exceed this memory, then it would automatically remove elements from the left
+        self.prioritized = prioritized
+        # If we exceed this memory, then the oldest transitions are overwritten
+        buffer = BUFFERS[MEMMAP_FOLDER is not None, COMPACT_MEMORY, prioritized]
+        if MEMMAP_FOLDER is not None:
+            self.memory = buffer(MEMMAP_FOLDER, MAX_MEMORY, 15, 5)
+        else:
+            self.memory = buffer(MAX_MEMORY, 15, 5)
         self.model = Linear_QNet(15, 256, 5) # Model: input, hidden, output size
         self.trainer = QTrainer(self.model, lr=LR, gamma=self.gamma) # trainer
+        self.prefetcher = None
 
-    def get_state(self, game, player):
-        # State consists of 15 values
-        # [
-        #  direction left, direction right, direction up, direction down,
-        #  grabbed_object
-        #  ray1, ray2, ray3, ray4, ray5, ray6, ray7, ra8, ray9, ray10
-        # ]
-
-        # Agent Direction
-        direction = player.direction
-        direction_list = [0, 0, 0, 0]
-        direction_list[direction-1] = 1
-
-        # Binary has agent grabbed an object
-        grabbed_object = [1] if player.grabbed_obj else [0]
+    def prefetch(self, batch_size, depth):
+        # Batches of this size are sampled in the background from now on
+        self.stop_prefetch()
+        self.prefetcher = BatchPrefetcher(self.memory, batch_size, depth)
 
-        # Agent FOV
-        fov = player.fov
-        encoded_fov = game.encode_fov(fov)
+    def stop_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
 
-        state = direction_list + grabbed_object + encoded_fov
+    def sample(self, batch_size):
+        # The batch waiting in the prefetcher if there is one of this size. The prefetcher only samples full
+        # batches, a smaller memory is sampled whole right here
+        if self.prefetcher is not None and self.prefetcher.batch_size == batch_size \
+                and len(self.memory) >= batch_size:
+            return self.prefetcher.get()
 
-        return np.array(state, dtype=int)
+        return self.memory.sample(batch_size)
 
-    def train_long_memory(self):
+    def train_long_memory(self, batch_size=BATCH_SIZE):
         # We grab 1000 samples from our memory
         # We sample at random from the memory
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE)  # list of tuples
+        # If we don't 1000 samples, then we simply get the whole memory
+        if self.prioritized:
+            # Sampled by priority, the update is weighted and the new TD errors become the priorities
+            states, actions, rewards, next_states, dones, weights, idx = self.sample(batch_size)
+            td_errors = self.trainer.train_step(states, actions, rewards, next_states, dones, weights)
+            self.memory.update_priorities(idx, td_errors.numpy())
         else:
-            # If we don't 1000 samples, then we simply get the whole memory
-            mini_sample = self.memory
-
-        # We put every state, action, reward together
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        # We call the trainer for multiple states, actions, rewards, etc
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
-
-        # for state, action, reward, nexrt_state, done in mini_sample:
-        #    self.trainer.train_step(state, action, reward, next_state, done)
+            states, actions, rewards, next_states, dones = self.sample(batch_size)
+            # We call the trainer for multiple states, actions, rewards, etc
+            self.trainer.train_step(states, actions, rewards, next_states, dones)
 
     def train_short_memory(self, state, action, reward, next_state, game_over):
         # This trainer is called to the the optimization
@@ -77,36 +95,70 @@ class Agent:
         self.trainer.train_step(state, action, reward, next_state, game_over)
 
     def remember(self, state, action, reward, next_state, game_over):
-        # We store this tuple of value in the memory
-        self.memory.append((state, action, reward, next_state, game_over)) # Can only go to 100 000
+        # We store this transition in the memory
+        self.memory.push(state, action, reward, next_state, game_over) # Can only go to 100 000
 
     def get_action(self, state):
         # Get the action based on the state
         # At the beggining do some random moves: Exploration / exploitation
         # The better our agent gets, the less random moves we want to get and the more we want to explore
-        self.epsilon = 80 - self.n_games  # We can play around with this value
-        final_move = [0, 0, 0, 0, 0]  # LEFT, RIGHT, UP, DOWN, GRAB/RELEASE
+        move = get_actions([self], [state])[0]  # Int
+
+        return one_hot(move)  # LEFT, RIGHT, UP, DOWN, GRAB/RELEASE
+
+
+def one_hot(move):
+    final_move = [0, 0, 0, 0, 0]
+    final_move[move] = 1
+
+    return final_move
 
-        # The more games, the smaller the epsilon, the less frequent we move randomly
-        if random.randint(0, 200) < self.epsilon:
-            move = random.randint(0, 4)
-            final_move[move] = 1
-        else:
-            # Convert to tensor
-            state0 = torch.tensor(state, dtype=torch.float)
-            prediction = self.model(state0)  # Predict the action based on one state (This executes the forward function)
-            # It will return a list, containing raw float values, from which we want the argmax
-            # Then we set the argmax item to 1
-            move = torch.argmax(prediction).item()  # Int
-            final_move[move] = 1
 
-        return final_move
+def get_actions(agents, states, models=None):
+    # Epsilon greedy actions for several agents at once. The last but one axis of states lines up with
+    # agents: (4, 15) for the players of one Game, or (n_games, 4, 15) for a VecGame.
+    # models: the networks to act with instead of the agents' own (the actor copies of a Learner).
+    # Returns the action indices, an int array of shape states.shape[:-1]
+    states = to_tensor(states, torch.float)
 
+    # The more games, the smaller the epsilon, the less frequent we move randomly
+    for agent in agents:
+        agent.epsilon = 80 - agent.n_games  # We can play around with this value
+    epsilon = torch.tensor([agent.epsilon for agent in agents])
+    if models is None:
+        models = [agent.model for agent in agents]
 
-def train(intrinsic_motivation=False, situated_moves=False):
+    # One batched forward pass through all the networks, then the argmax of the raw Q values
+    with torch.no_grad():
+        actions = torch.argmax(stacked_forward(models, states), dim=-1)
+
+    explore = torch.randint(0, 201, actions.shape) < epsilon
+    if explore.any():
+        actions = torch.where(explore, torch.randint(0, 5, actions.shape), actions)
+
+    return actions.numpy()
+
+def train(intrinsic_motivation=False, situated_moves=False, render=True, prioritized=False, background_plot=False,
+          resume=False, n_episodes=2000, async_learner=False):
     file_name = 'RETESTED_situated'  # '_situated' if situated_moves else '_regular'
     motivation_suffix = 'fov100'  # '_intrinsic' if intrinsic_motivation else ''  # emergent
     round_winners = {'hiders': 0, 'seekers': 0}
+
+    # The state of the run after the latest snapshot, None to start over
+    snapshot = load_snapshot(file_name) if resume else None
+    if resume and snapshot is None:
+        print('No snapshot to resume from, starting over')
+
+    # A resumed run keeps the rows of the games in the snapshot and drops those played after it
+    metrics = MetricsWriter({
+        'hider_rewards': 'hider_rewards{}{}.csv'.format(file_name, motivation_suffix),
+        'seeker_rewards': 'seeker_rewards{}{}.csv'.format(file_name, motivation_suffix),
+        'hiders_interaction': 'hiders_interaction{}{}.csv'.format(file_name, motivation_suffix),
+        'seekers_interaction': 'seekers_interaction{}{}.csv'.format(file_name, motivation_suffix),
+    }, 'round_winners{}{}.csv'.format(file_name, motivation_suffix),
+        keep_rows=snapshot['n_games'] if snapshot is not None else 0)
+    plotter = BackgroundPlotter('training_rewards{}{}.png'.format(file_name, motivation_suffix)) \
+        if background_plot else None
     hiders_total_interaction_times = []
     seekers_total_interaction_times = []
 
@@ -122,66 +174,115 @@ def train(intrinsic_motivation=False, situated_moves=False):
     total_reward_seeker_team = 0
     best_seeker_team_reward = float('-inf')
 
-    agent_ha = Agent()
-    agent_hb = Agent()
-
-    agent_sa = Agent()
-    agent_sb = Agent()
-
-    game = Game(screen)
+    agent_ha = Agent(prioritized)
+    agent_hb = Agent(prioritized)
+
+    agent_sa = Agent(prioritized)
+    agent_sb = Agent(prioritized)
+    agents = [agent_ha, agent_hb, agent_sa, agent_sb]
+    roles = {'ha': agent_ha, 'hb': agent_hb, 'sa': agent_sa, 'sb': agent_sb}
+
+    # Models and snapshots are written by a background thread
+    checkpoints = CheckpointManager(file_name, every=SAVE_EVERY, keep_recent=KEEP_RECENT, keep_best=KEEP_BEST)
+    learner = None
+
+    if snapshot is not None:
+        restore_snapshot(snapshot, roles)
+        progress = snapshot['progress']
+        round_winners = progress['round_winners']
+        hiders_total_interaction_times = progress['hiders_interaction']
+        seekers_total_interaction_times = progress['seekers_interaction']
+        plot_hider_rewards, plot_seeker_rewards = progress['hider_rewards'], progress['seeker_rewards']
+        plot_mean_hider_rewards = progress['mean_hider_rewards']
+        plot_mean_seeker_rewards = progress['mean_seeker_rewards']
+        total_reward_hider_team = progress['total_hider_reward']
+        total_reward_seeker_team = progress['total_seeker_reward']
+        best_hider_team_reward = progress['best_hider_reward']
+        best_seeker_team_reward = progress['best_seeker_reward']
+        print('Resuming after game', snapshot['n_games'])
+
+        if plotter is not None:
+            for scores in zip(plot_hider_rewards, plot_seeker_rewards,
+                              plot_mean_hider_rewards, plot_mean_seeker_rewards):
+                plotter.append(*scores)
+
+    if async_learner and PREFETCH_BATCHES:
+        # Only for the back to back updates of the learner, a batch for the end of an episode would be sampled
+        # an episode early. After the snapshot is restored too, the prefetchers sample from the restored memories
+        for agent in agents:
+            agent.prefetch(LEARNER_BATCH_SIZE, PREFETCH_BATCHES)
+    if async_learner:
+        # Started after the snapshot is restored, the players act with copies of the restored models
+        learner = Learner(agents, REPLAY_RATIO, PUBLISH_EVERY, LEARNER_BATCH_SIZE)
+    # Checkpoints and snapshots wait for the update the learner is in the middle of
+    learning = learner.lock if learner is not None else contextlib.nullcontext()
+
+    game = Game(render=render)
+
+    # State of a player consists of 15 values, kept up to date by the game in its row of game.obs
+    # [
+    #  direction left, direction right, direction up, direction down,
+    #  grabbed_object
+    #  ray1, ray2, ray3, ray4, ray5, ray6, ray7, ra8, ray9, ray10
+    # ]
+    # The new states of one tick are the old states of the next, so the states of the four players are copied
+    # out of game.obs once per tick. Two float32 buffers take turns being old and new, and the tensors share
+    # their memory, so the networks and the replay memory read them without any further copies
+    states = np.zeros((2, len(agents), STATE_SIZE), dtype=np.float32)
+    state_tensors = torch.from_numpy(states)
+    old, new = 0, 1
+    states[old] = game.obs
     while True:
-        # Clear and then update the screen
-        game.screen.fill(LIME)
-        game.hiders_group.draw(game.screen)
-        game.seekers_group.draw(game.screen)
-        game.walls_group.draw(game.screen)
-        game.crates_group.draw(game.screen)
-        game.hammers_group.draw(game.screen)
-
-        # Get the previous game state for hiders
-        hider_a_state_old = agent_ha.get_state(game, game.hider_a)
-        hider_b_state_old = agent_hb.get_state(game, game.hider_b)
-
-        # Get the previous game state for seekers
-        seeker_a_state_old = agent_sa.get_state(game, game.seeker_a)
-        seeker_b_state_old = agent_sb.get_state(game, game.seeker_b)
-
-        # Get the move based on the previous game state for hiders
-        action_ha = agent_ha.get_action(hider_a_state_old)
-        action_hb = agent_hb.get_action(hider_b_state_old)
-
-        # Get the move based on the previous game state for seekers
-        action_sa = agent_sa.get_action(seeker_a_state_old)
-        action_sb = agent_sb.get_action(seeker_b_state_old)
+        if render:
+            with profiling.phase('train.draw'):
+                # Clear and then update the screen
+                game.screen.fill(LIME)
+                game.hiders_group.draw(game.screen)
+                game.seekers_group.draw(game.screen)
+                game.walls_group.draw(game.screen)
+                game.crates_group.draw(game.screen)
+                game.hammers_group.draw(game.screen)
+
+        # Get the previous game state for hiders and seekers
+        hider_a_state_old, hider_b_state_old, seeker_a_state_old, seeker_b_state_old = state_tensors[old]
+
+        with profiling.phase('train.get_action'):
+            # Get the moves of all players based on their previous game states, in one batch
+            moves = get_actions(agents, state_tensors[old], learner.actor_models if learner is not None else None)
+            action_ha, action_hb, action_sa, action_sb = (one_hot(move) for move in moves)
 
         # Perform action and add rewards to teams
         game_over, r_seekers, r_hiders, winner = game.tick(action_ha, action_hb, action_sa, action_sb, situated_moves)
         reward_hider_team += r_hiders
         reward_seeker_team += r_seekers
 
-        # Get the current new game state for hiders
-        hider_a_state_new = agent_ha.get_state(game, game.hider_a)
-        hider_b_state_new = agent_hb.get_state(game, game.hider_b)
+        with profiling.phase('train.get_state'):
+            # Get the current new game state for hiders and seekers
+            states[new] = game.obs
+            hider_a_state_new, hider_b_state_new, seeker_a_state_new, seeker_b_state_new = state_tensors[new]
 
-        # Get the current new game state for seekers
-        seeker_a_state_new = agent_sa.get_state(game, game.seeker_a)
-        seeker_b_state_new = agent_sb.get_state(game, game.seeker_b)
+        if learner is None:
+            with profiling.phase('train.short_memory'):
+                # Train the short memory of hiders
+                agent_ha.train_short_memory(hider_a_state_old, action_ha, r_hiders, hider_a_state_new, game_over)
+                agent_hb.train_short_memory(hider_b_state_old, action_hb, r_hiders, hider_b_state_new, game_over)
 
-        # Train the short memory of hiders
-        agent_ha.train_short_memory(hider_a_state_old, action_ha, r_hiders, hider_a_state_new, game_over)
-        agent_hb.train_short_memory(hider_b_state_old, action_hb, r_hiders, hider_b_state_new, game_over)
+                # Train the short memory of seekers
+                agent_sa.train_short_memory(seeker_a_state_old, action_sa, r_seekers, seeker_a_state_new, game_over)
+                agent_sb.train_short_memory(seeker_b_state_old, action_sb, r_seekers, seeker_b_state_new, game_over)
 
-        # Train the short memory of seekers
-        agent_sa.train_short_memory(seeker_a_state_old, action_sa, r_seekers, seeker_a_state_new, game_over)
-        agent_sb.train_short_memory(seeker_b_state_old, action_sb, r_seekers, seeker_b_state_new, game_over)
+        with profiling.phase('train.remember'):
+            # Store in the memory deque for hider agents
+            agent_ha.remember(hider_a_state_old, action_ha, r_hiders, hider_a_state_new, game_over)
+            agent_hb.remember(hider_b_state_old, action_hb, r_hiders, hider_b_state_new, game_over)
 
-        # Store in the memory deque for hider agents
-        agent_ha.remember(hider_a_state_old, action_ha, r_hiders, hider_a_state_new, game_over)
-        agent_hb.remember(hider_b_state_old, action_hb, r_hiders, hider_b_state_new, game_over)
+            # Store in the memory deque for hider agents
+            agent_sa.remember(seeker_a_state_old, action_sa, r_hiders, seeker_a_state_new, game_over)
+            agent_sb.remember(seeker_b_state_old, action_sb, r_hiders, seeker_b_state_new, game_over)
 
-        # Store in the memory deque for hider agents
-        agent_sa.remember(seeker_a_state_old, action_sa, r_hiders, seeker_a_state_new, game_over)
-        agent_sb.remember(seeker_b_state_old, action_sb, r_hiders, seeker_b_state_new, game_over)
+        if learner is not None:
+            # Lets the learner catch up with the new transitions and picks up its latest weights
+            learner.step()
 
         print(reward_hider_team, reward_seeker_team)
         if game_over:
@@ -192,8 +293,10 @@ def train(intrinsic_motivation=False, situated_moves=False):
             # Collect round winner data
             round_winners[winner] += 1
 
-            # Reset game and all player instances
-            game.reset()
+            with profiling.phase('episode.reset'):
+                # Reset game and all player instances, the next tick starts from the fresh states
+                game.reset()
+                states[new] = game.obs
 
             # Add number of games
             agent_ha.n_games += 1
@@ -201,21 +304,25 @@ def train(intrinsic_motivation=False, situated_moves=False):
             agent_sa.n_games += 1
             agent_sb.n_games += 1
 
-            # Experience replay
-            agent_ha.train_long_memory()
-            agent_hb.train_long_memory()
-            agent_sa.train_long_memory()
-            agent_sb.train_long_memory()
+            if learner is None:
+                with profiling.phase('episode.long_memory'):
+                    # Experience replay
+                    agent_ha.train_long_memory()
+                    agent_hb.train_long_memory()
+                    agent_sa.train_long_memory()
+                    agent_sb.train_long_memory()
+
+            with profiling.phase('episode.checkpoint'), learning:
+                checkpoints.save(agent_ha.n_games, {'ha': agent_ha.model, 'hb': agent_hb.model,
+                                                    'sa': agent_sa.model, 'sb': agent_sb.model})
 
-            # if reward_hider_team > best_hider_team_reward:
-            #     best_hider_team_reward = reward_hider_team
-            agent_ha.model.save('model_ha{}.pth'.format(file_name))
-            agent_hb.model.save('model_hb{}.pth'.format(file_name))
+                if reward_hider_team > best_hider_team_reward:
+                    best_hider_team_reward = reward_hider_team
+                    checkpoints.save_best(agent_ha.n_games, {'ha': agent_ha.model, 'hb': agent_hb.model})
 
-            # if reward_seeker_team > best_seeker_team_reward:
-            #     best_seeker_team_reward = reward_seeker_team
-            agent_sa.model.save('model_sa{}.pth'.format(file_name))
-            agent_sb.model.save('model_sb{}.pth'.format(file_name))
+                if reward_seeker_team > best_seeker_team_reward:
+                    best_seeker_team_reward = reward_seeker_team
+                    checkpoints.save_best(agent_sa.n_games, {'sa': agent_sa.model, 'sb': agent_sb.model})
 
             print('R_hiders:', reward_hider_team, 'Games', agent_ha.n_games)
             print('R_seekers:', reward_seeker_team, 'Games', agent_sa.n_games)
@@ -232,31 +339,57 @@ def train(intrinsic_motivation=False, situated_moves=False):
             plot_mean_hider_rewards.append(total_reward_hider_team/agent_ha.n_games)
             plot_mean_seeker_rewards.append(total_reward_seeker_team/agent_sa.n_games)
 
+            # Append this episode to the CSV files
+            metrics.append({'hider_rewards': reward_hider_team, 'seeker_rewards': reward_seeker_team,
+                            'hiders_interaction': hiders_total_interaction_times[-1],
+                            'seekers_interaction': seekers_total_interaction_times[-1]}, round_winners)
+
             reward_hider_team, reward_seeker_team = 0, 0
             # total_score += r_hiders
             # mean_score = total_score / agent_ha.n_games
             # plot_hider_mean_rewards.append(mean_score)
-            save_to_csv(plot_hider_rewards, 'hider_rewards{}{}.csv'.format(file_name,
-                                                                           motivation_suffix))
-            save_to_csv(plot_seeker_rewards, 'seeker_rewards{}{}.csv'.format(file_name,
-                                                                             motivation_suffix))
-            save_to_csv(hiders_total_interaction_times, 'hiders_interaction{}{}.csv'.format(file_name,
-                                                                                            motivation_suffix))
-            save_to_csv(seekers_total_interaction_times, 'seekers_interaction{}{}.csv'.format(file_name,
-                                                                                              motivation_suffix))
-            save_dict_to_csv(round_winners, 'round_winners{}{}.csv'.format(file_name,
-                                                                           motivation_suffix))
-
-            plot_rewards(plot_hider_rewards, plot_seeker_rewards, plot_mean_hider_rewards, plot_mean_seeker_rewards)
-
-            if agent_ha.n_games >= 2000:
+
+            if SNAPSHOT_EVERY and agent_ha.n_games % SNAPSHOT_EVERY == 0:
+                # The CSVs have to hold every game of the snapshot, a resumed run continues after them
+                metrics.flush()
+                with profiling.phase('episode.snapshot'), learning:
+                    checkpoints.save_snapshot(agent_ha.n_games, roles, {
+                        'round_winners': round_winners,
+                        'hiders_interaction': hiders_total_interaction_times,
+                        'seekers_interaction': seekers_total_interaction_times,
+                        'hider_rewards': plot_hider_rewards, 'seeker_rewards': plot_seeker_rewards,
+                        'mean_hider_rewards': plot_mean_hider_rewards, 'mean_seeker_rewards': plot_mean_seeker_rewards,
+                        'total_hider_reward': total_reward_hider_team, 'total_seeker_reward': total_reward_seeker_team,
+                        'best_hider_reward': best_hider_team_reward, 'best_seeker_reward': best_seeker_team_reward,
+                    })
+
+            with profiling.phase('episode.plot'):
+                if plotter is not None:
+                    plotter.append(plot_hider_rewards[-1], plot_seeker_rewards[-1],
+                                   plot_mean_hider_rewards[-1], plot_mean_seeker_rewards[-1])
+                else:
+                    plot_rewards(plot_hider_rewards, plot_seeker_rewards,
+                                 plot_mean_hider_rewards, plot_mean_seeker_rewards)
+
+            if agent_ha.n_games >= n_episodes:
+                if learner is not None:
+                    learner.close()
+                for agent in agents:
+                    agent.stop_prefetch()
+                metrics.close()
+                checkpoints.close()
+                if plotter is not None:
+                    plotter.close()
                 break
             # plot_interaction(hiders_interaction_times, seekers_interaction_times)
 
+        old, new = new, old
+
 
 if __name__ == '__main__':
     # Set global variables to preference
     situated = True if SITUATED else False
     intrinsic = True if INTRINSIC else False
 
-    train(intrinsic_motivation=intrinsic, situated_moves=situated)
+    train(intrinsic_motivation=intrinsic, situated_moves=situated, render=RENDER, prioritized=PRIORITIZED,
+          background_plot=BACKGROUND_PLOT, resume=RESUME, async_learner=ASYNC_LEARNER)
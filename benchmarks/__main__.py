@@ -0,0 +1,131 @@
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+import numpy as np
+import pygame
+import torch
+
+from benchmarks import game_tick, fov, inference, train_step, replay, end_to_end
+
+# Runs the whole suite and writes the results as JSON together with the machine and library versions they
+# were measured on. With --compare, every result is checked against the same benchmark in a stored
+# baseline and slowdowns beyond --threshold are flagged (and make the exit status 1).
+#
+#   python -m benchmarks --output results.json
+#   python -m benchmarks --only game_tick fov --compare baseline.json
+
+# name, run, the fields of a row that identify the case, the field compared, whether higher is better
+SUITE = [
+    ('game_tick', game_tick.run, ('situated',), 'steps_per_s', True),
+    ('fov', fov.run, ('objects',), 'cold_us', False),
+    ('inference', inference.run, ('mode', 'games'), 'us_per_call', False),
+    ('train_step', train_step.run, ('batch_size',), 'batched_ms', False),
+    ('replay', replay.run, ('buffer', 'size'), 'us_per_sample', False),
+    ('end_to_end', end_to_end.run, ('episodes',), 'steps_per_s', True),
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': torch.multiprocessing.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'pygame': pygame.version.ver,
+    }
+
+
+def run_suite(only=None):
+    results = []
+    for name, run, keys, metric, higher_is_better in SUITE:
+        if only and name not in only:
+            continue
+
+        print('Running', name, file=sys.stderr)
+        for row in run():
+            results.append({'benchmark': name, 'params': {key: row[key] for key in keys}, 'metric': metric,
+                            'value': row[metric], 'higher_is_better': higher_is_better, 'row': row})
+
+    return {'metadata': metadata(), 'results': results}
+
+
+def result_key(result):
+    return result['benchmark'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(report, baseline, threshold):
+    # Returns the results that got slower than the baseline by more than threshold (a fraction)
+    old_results = {result_key(result): result for result in baseline['results']}
+    slower = []
+
+    print('{:<12} {:<36} {:>12} {:>12} {:>9}  {}'.format('benchmark', 'case', 'baseline', 'now', 'change', ''))
+    for result in report['results']:
+        old = old_results.get(result_key(result))
+        case = ', '.join('{}={}'.format(key, value) for key, value in result['params'].items())
+        if old is None:
+            print('{:<12} {:<36} {:>12} {:>12.4g} {:>9}  new'.format(result['benchmark'], case, '-',
+                                                                      result['value'], '-'))
+            continue
+
+        # Positive change is better, whichever direction the metric goes
+        change = result['value'] / old['value'] - 1
+        if not result['higher_is_better']:
+            change = old['value'] / result['value'] - 1
+
+        status = ''
+        if change < -threshold:
+            status = 'SLOWER'
+            slower.append(result)
+        elif change > threshold:
+            status = 'faster'
+        print('{:<12} {:<36} {:>12.4g} {:>12.4g} {:>+8.1%}  {}'.format(result['benchmark'], case, old['value'],
+                                                                       result['value'], change, status))
+
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Simulator, inference and learner benchmarks')
+    parser.add_argument('--only', nargs='+', choices=[name for name, *_ in SUITE], help='benchmarks to run')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--compare', metavar='BASELINE', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown (fraction) that counts as a regression, 0.1 by default')
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.only)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to', args.output, file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(report, baseline, args.threshold)
+        if slower:
+            print('{} benchmark(s) slower than the baseline by more than {:.0%}'.format(len(slower), args.threshold))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import os
+import time
+import tempfile
+import contextlib
+
+import agent
+
+# End to end training throughput: agent.train headless for a fixed number of episodes, in environment
+# steps (ticks) per second. It runs in a scratch folder, so the models, snapshots and CSVs it writes don't
+# touch those of the real runs, and its per tick output goes nowhere.
+#
+#   python -m benchmarks.end_to_end
+
+N_EPISODES = 3
+
+
+def run(n_episodes=N_EPISODES):
+    ticks = 0
+    original_tick = agent.Game.tick
+
+    def counted_tick(self, *args, **kwargs):
+        nonlocal ticks
+        ticks += 1
+        return original_tick(self, *args, **kwargs)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        agent.Game.tick = counted_tick
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                agent.train(situated_moves=True, render=False, background_plot=True, n_episodes=n_episodes)
+                seconds = time.perf_counter() - start
+        finally:
+            agent.Game.tick = original_tick
+            os.chdir(cwd)
+
+    return [{'episodes': n_episodes, 'steps': ticks, 'seconds': seconds, 'steps_per_s': ticks / seconds}]
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>10} {:>10} {:>12}'.format('episodes', 'steps', 'seconds', 'steps/s'))
+    for result in run():
+        print('{episodes:>10} {steps:>10} {seconds:>10.1f} {steps_per_s:>12.0f}'.format(**result))
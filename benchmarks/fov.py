@@ -0,0 +1,41 @@
+import numpy as np
+
+from hide_seek import Game, Crate, WINDOW_W, WINDOW_H
+from benchmarks.train_step import time_call
+
+# Game.get_all_fov latency against the number of objects on the map. Extra crates are scattered over the
+# arena. Cold is a full recast of every ray (the FOV cache emptied before each call), warm is the cached
+# path of a tick where nothing moved.
+#
+#   python -m benchmarks.fov
+
+EXTRA_OBJECTS = (0, 8, 32, 128)
+
+
+def run(extra_objects=EXTRA_OBJECTS, min_time=0.5):
+    results = []
+
+    for n_extra in extra_objects:
+        rng = np.random.default_rng(n_extra)
+        game = Game(render=False)
+        for x, y in zip(rng.integers(0, WINDOW_W - 20, n_extra), rng.integers(0, WINDOW_H - 20, n_extra)):
+            game.crates_group.add(Crate(int(x), int(y)))
+
+        def cold():
+            game.fov_cache.clear()
+            game.get_all_fov()
+
+        repeat = max(1, int(min_time / time_call(cold, 1)))
+        cold_s = time_call(cold, repeat)
+        warm_s = time_call(game.get_all_fov, repeat)
+
+        n_objects = sum(len(group) for group, _ in game.fov_groups())
+        results.append({'objects': n_objects, 'cold_us': cold_s * 1e6, 'warm_us': warm_s * 1e6})
+
+    return results
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>12} {:>12}'.format('objects', 'cold us', 'warm us'))
+    for result in run():
+        print('{objects:>10} {cold_us:>12.1f} {warm_us:>12.1f}'.format(**result))
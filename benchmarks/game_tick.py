@@ -0,0 +1,38 @@
+import time
+import numpy as np
+
+from hide_seek import Game
+
+# Raw simulator throughput: headless Game.tick with random actions, resetting after every game over.
+#
+#   python -m benchmarks.game_tick
+
+
+def random_actions(n_ticks, rng):
+    # One hot actions for the four players of every tick, drawn up front so only tick is timed
+    return np.eye(5, dtype=int)[rng.integers(0, 5, size=(n_ticks, 4))].tolist()
+
+
+def run(n_ticks=5000, situated_modes=(False, True)):
+    rng = np.random.default_rng(0)
+    results = []
+
+    for situated in situated_modes:
+        game = Game(render=False)
+        actions = random_actions(n_ticks, rng)
+
+        start = time.perf_counter()
+        for action_ha, action_hb, action_sa, action_sb in actions:
+            if game.tick(action_ha, action_hb, action_sa, action_sb, situated)[0]:
+                game.reset()
+        seconds = time.perf_counter() - start
+
+        results.append({'situated': situated, 'steps_per_s': n_ticks / seconds, 'us_per_tick': seconds / n_ticks * 1e6})
+
+    return results
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>12} {:>12}'.format('situated', 'steps/s', 'us/tick'))
+    for result in run():
+        print('{situated!s:>10} {steps_per_s:>12.0f} {us_per_tick:>12.1f}'.format(**result))
@@ -0,0 +1,51 @@
+import numpy as np
+import torch
+
+from agent import Agent, get_actions
+from hide_seek import STATE_SIZE
+from benchmarks.train_step import time_call
+
+# Action selection latency: Agent.get_action for one state, and get_actions for the four players of one
+# game and of a batch of games (as used with VecGame).
+#
+#   python -m benchmarks.inference
+
+N_GAMES = (1, 16, 256)
+
+
+def random_states(shape, rng):
+    # States shaped like game.obs rows: a one hot direction, a grab bit and ten ray codes
+    states = np.zeros(shape + (STATE_SIZE,), dtype=np.float32)
+    directions = rng.integers(0, 4, size=shape)
+    np.put_along_axis(states, directions[..., None], 1, axis=-1)
+    states[..., 4] = rng.integers(0, 2, size=shape)
+    states[..., 5:] = rng.integers(0, 6, size=shape + (STATE_SIZE - 5,))
+
+    return states
+
+
+def run(n_games=N_GAMES, min_time=0.5):
+    torch.set_num_threads(1)
+    rng = np.random.default_rng(0)
+    agents = [Agent() for _ in range(4)]
+    results = []
+
+    state = random_states((), rng)
+    repeat = max(1, int(min_time / time_call(lambda: agents[0].get_action(state), 1)))
+    seconds = time_call(lambda: agents[0].get_action(state), repeat)
+    results.append({'mode': 'single', 'games': 1, 'us_per_call': seconds * 1e6, 'us_per_action': seconds * 1e6})
+
+    for games in n_games:
+        states = random_states((games, 4), rng)
+        repeat = max(1, int(min_time / time_call(lambda: get_actions(agents, states), 1)))
+        seconds = time_call(lambda: get_actions(agents, states), repeat)
+        results.append({'mode': 'batched', 'games': games, 'us_per_call': seconds * 1e6,
+                        'us_per_action': seconds * 1e6 / (games * 4)})
+
+    return results
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>8} {:>12} {:>14}'.format('mode', 'games', 'us/call', 'us/action'))
+    for result in run():
+        print('{mode:>10} {games:>8} {us_per_call:>12.1f} {us_per_action:>14.2f}'.format(**result))
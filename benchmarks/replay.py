@@ -0,0 +1,44 @@
+import numpy as np
+
+from replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+from benchmarks.inference import random_states
+from benchmarks.train_step import time_call
+
+# Cost of sampling a BATCH_SIZE batch from a full replay memory of 10k, 100k and 1M transitions, uniform
+# and prioritized.
+#
+#   python -m benchmarks.replay
+
+SIZES = (10_000, 100_000, 1_000_000)
+BATCH_SIZE = 1000
+
+
+def fill(buffer, rng, chunk=100_000):
+    for start in range(0, buffer.capacity, chunk):
+        n = min(chunk, buffer.capacity - start)
+        buffer.push_batch(random_states((n,), rng), np.eye(5, dtype=np.int64)[rng.integers(0, 5, n)],
+                          rng.integers(-1, 2, n), random_states((n,), rng), rng.random(n) < 0.01)
+
+
+def run(sizes=SIZES, batch_size=BATCH_SIZE, min_time=0.5):
+    rng = np.random.default_rng(0)
+    results = []
+
+    for buffer_class in (ReplayBuffer, PrioritizedReplayBuffer):
+        for size in sizes:
+            buffer = buffer_class(size, 15, 5)
+            buffer.rng = np.random.default_rng(0)
+            fill(buffer, rng)
+
+            repeat = max(1, int(min_time / time_call(lambda: buffer.sample(batch_size), 1)))
+            seconds = time_call(lambda: buffer.sample(batch_size), repeat)
+            results.append({'buffer': buffer_class.__name__, 'size': size, 'us_per_sample': seconds * 1e6})
+            del buffer
+
+    return results
+
+
+if __name__ == '__main__':
+    print('{:>24} {:>10} {:>14}'.format('buffer', 'size', 'us/sample'))
+    for result in run():
+        print('{buffer:>24} {size:>10} {us_per_sample:>14.1f}'.format(**result))
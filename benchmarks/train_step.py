@@ -0,0 +1,86 @@
+import copy
+import time
+import numpy as np
+import torch
+
+from model import Linear_QNet, QTrainer
+
+# Compares QTrainer.train_step with the per sample loop it replaced, at the batch sizes agent.train uses
+# (1 for train_short_memory, BATCH_SIZE = 1000 for train_long_memory).
+#
+#   python -m benchmarks.train_step
+
+BATCH_SIZES = (1, 64, 1000)
+
+
+def looped_train_step(trainer, state, action, reward, next_state, game_over):
+    # The original implementation: one forward pass per next state
+    state = torch.tensor(np.array(state), dtype=torch.float)
+    next_state = torch.tensor(np.array(next_state), dtype=torch.float)
+    action = torch.tensor(np.array(action), dtype=torch.long)
+    reward = torch.tensor(np.array(reward), dtype=torch.float)
+
+    pred = trainer.model(state)
+    target = pred.clone()
+    for idx in range(len(game_over)):
+        Q_new = reward[idx]
+        if not game_over[idx]:
+            Q_new = reward[idx] + trainer.gamma * torch.max(trainer.model(next_state[idx]))
+        target[idx][torch.argmax(action[idx]).item()] = Q_new
+
+    trainer.optimizer.zero_grad()
+    loss = trainer.criterion(target, pred)
+    loss.backward()
+    trainer.optimizer.step()
+
+
+def make_batch(batch_size, rng):
+    # Transitions shaped like the ones in Agent.memory
+    states = tuple(rng.integers(0, 6, size=15) for _ in range(batch_size))
+    next_states = tuple(rng.integers(0, 6, size=15) for _ in range(batch_size))
+    actions = tuple(list(np.eye(5, dtype=int)[rng.integers(0, 5)]) for _ in range(batch_size))
+    rewards = tuple(int(r) for r in rng.integers(-1, 2, size=batch_size))
+    dones = tuple(bool(d) for d in rng.random(batch_size) < 0.01)
+
+    return states, actions, rewards, next_states, dones
+
+
+def time_call(func, repeat):
+    func()  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+
+    return (time.perf_counter() - start) / repeat
+
+
+def run(batch_sizes=BATCH_SIZES, min_time=0.5):
+    torch.set_num_threads(1)
+    rng = np.random.default_rng(0)
+    results = []
+
+    for batch_size in batch_sizes:
+        batch = make_batch(batch_size, rng)
+        model = Linear_QNet(15, 256, 5)
+        batched = QTrainer(model, lr=0.001, gamma=0.9)
+        looped = QTrainer(copy.deepcopy(model), lr=0.001, gamma=0.9)
+
+        # Both paths have to make the same update
+        batched.train_step(*batch)
+        looped_train_step(looped, *batch)
+        for p_batched, p_looped in zip(batched.model.parameters(), looped.model.parameters()):
+            assert torch.allclose(p_batched, p_looped, atol=1e-6), 'batched train_step diverged from the loop'
+
+        repeat = max(1, int(min_time / time_call(lambda: looped_train_step(looped, *batch), 1)))
+        looped_s = time_call(lambda: looped_train_step(looped, *batch), repeat)
+        batched_s = time_call(lambda: batched.train_step(*batch), repeat)
+        results.append({'batch_size': batch_size, 'looped_ms': looped_s * 1e3, 'batched_ms': batched_s * 1e3,
+                        'speedup': looped_s / batched_s})
+
+    return results
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>12} {:>12} {:>9}'.format('batch', 'looped ms', 'batched ms', 'speedup'))
+    for result in run():
+        print('{batch_size:>10} {looped_ms:>12.3f} {batched_ms:>12.3f} {speedup:>8.1f}x'.format(**result))
@@ -0,0 +1,233 @@
+import os
+import re
+import copy
+import json
+import queue
+import random
+import shutil
+import threading
+import collections
+import numpy as np
+import torch
+
+# Saving the models in the background. The training loop only copies the weights (a few hundred KB) and
+# queues them, a thread serializes and writes them. Every file is written to a temporary name and then
+# renamed over the old one, so a crash in the middle of a save never leaves a broken checkpoint behind.
+#
+# Snapshots hold the whole training state for resuming: the models, optimizers and replay memories of the
+# agents, the games played, the random generators and whatever progress the training loop passes along.
+# Every snapshot is a folder under ./snapshots, the replay arrays are .npy files in it (loaded memory mapped)
+# and everything else is in state.pt. latest<suffix>.json names the newest complete snapshot
+
+
+def atomic_save(state, path):
+    torch.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def copy_state_dict(model):
+    # The training loop keeps updating the weights in place, the thread writes this copy
+    return {key: value.detach().clone() for key, value in model.state_dict().items()}
+
+
+class CheckpointManager:
+    # Writes model_<role><suffix>.pth for every role in the models passed to save(), like Linear_QNet.save.
+    # save() writes every `every` games (never if None) and also keeps the keep_recent latest ones as
+    # model_<role><suffix>_game<n>.pth. save_best() is called when a team improved its best reward, it writes
+    # model_<role><suffix>_best.pth and keeps the keep_best latest improvements as
+    # model_<role><suffix>_best<n>.pth. Older versions are deleted, also those an earlier run left in the folder
+
+    def __init__(self, suffix='', folder='./model', every=1, keep_recent=3, keep_best=3,
+                 snapshot_folder='./snapshots', keep_snapshots=2):
+        self.suffix = suffix
+        self.folder = folder
+        self.every = every
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.snapshot_folder = snapshot_folder
+        self.keep_snapshots = keep_snapshots
+        self.snapshots = collections.deque()  # Snapshot folders of this suffix, oldest first
+        if os.path.exists(snapshot_folder):
+            # Including those of an earlier (resumed) run, so they are rotated out too
+            pattern = re.escape('snapshot{}_game'.format(suffix)) + r'(\d+)'
+            found = [(int(match.group(1)), name) for name, match in
+                     ((name, re.fullmatch(pattern, name)) for name in os.listdir(snapshot_folder)) if match]
+            self.snapshots.extend(os.path.join(snapshot_folder, name) for _, name in sorted(found))
+
+        self.recent = {}  # role -> deque of the n_games of its versioned checkpoints on disk, oldest first
+        self.best = {}  # role -> deque of the n_games of its best versions on disk
+        self.keep_recent = keep_recent
+        self.keep_best = keep_best
+
+        self.jobs = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def path(self, role, tag=''):
+        return os.path.join(self.folder, 'model_{}{}{}.pth'.format(role, self.suffix, tag))
+
+    def save(self, n_games, models):
+        # models: role -> Linear_QNet, e.g. {'ha': agent_ha.model, ...}
+        if self.every is None or n_games % self.every:
+            return
+        self.check()
+
+        states = {role: copy_state_dict(model) for role, model in models.items()}
+        self.jobs.put((self.write_recent, (n_games, states)))
+
+    def save_best(self, n_games, models):
+        # Call with the models of a team after it beat its best reward
+        self.check()
+
+        states = {role: copy_state_dict(model) for role, model in models.items()}
+        self.jobs.put((self.write_best, (n_games, states)))
+
+    def write_recent(self, n_games, states):
+        for role, state in states.items():
+            atomic_save(state, self.path(role))
+            if self.keep_recent:
+                self.rotate(self.recent, role, '_game', n_games, state, self.keep_recent)
+
+    def write_best(self, n_games, states):
+        for role, state in states.items():
+            atomic_save(state, self.path(role, '_best'))
+            if self.keep_best:
+                # Only improvements get here, so the latest ones are also the best ones
+                self.rotate(self.best, role, '_best', n_games, state, self.keep_best)
+
+    def rotate(self, rotations, role, tag, n_games, state, keep):
+        # Saves model_<role><suffix><tag><n_games>.pth and deletes the oldest versions beyond keep. The versions
+        # of a role are looked up in the folder the first time, so a restarted or resumed run rotates out what
+        # the earlier one saved
+        versions = rotations.get(role)
+        if versions is None:
+            pattern = re.escape('model_{}{}{}'.format(role, self.suffix, tag)) + r'(\d+)\.pth'
+            found = (re.fullmatch(pattern, name) for name in os.listdir(self.folder))
+            versions = rotations[role] = collections.deque(sorted(int(match.group(1)) for match in found if match))
+
+        atomic_save(state, self.path(role, '{}{}'.format(tag, n_games)))
+        if n_games not in versions:
+            versions.append(n_games)
+        while len(versions) > keep:
+            self.remove([self.path(role, '{}{}'.format(tag, versions.popleft()))])
+
+    def save_snapshot(self, n_games, agents, progress):
+        # agents: role -> Agent, progress: anything picklable the training loop needs to resume (histories...)
+        self.check()
+
+        state = {
+            'n_games': n_games,
+            'progress': copy.deepcopy(progress),
+            'random': (random.getstate(), np.random.get_state(), torch.get_rng_state()),
+            'agents': {role: {'model': copy_state_dict(agent.model),
+                              'optimizer': copy.deepcopy(agent.trainer.optimizer.state_dict()),
+                              # A memory kept in files is saved by the thread, as it is once it's copied
+                              'memory': agent.memory if hasattr(agent.memory, 'save_files')
+                              else agent.memory.state_dict()}
+                       for role, agent in agents.items()},
+        }
+        self.jobs.put((self.write_snapshot, (n_games, state)))
+
+    def write_snapshot(self, n_games, state):
+        name = 'snapshot{}_game{}'.format(self.suffix, n_games)
+        folder = os.path.join(self.snapshot_folder, name)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder)
+
+        # The replay arrays go to their own files, so loading them doesn't go through pickle
+        for role, agent_state in state['agents'].items():
+            memory = agent_state['memory']
+            if not isinstance(memory, dict):
+                # A replay memory kept in files (MemmapStorage) is copied file to file, never through RAM
+                memory = agent_state['memory'] = memory.save_files(
+                    {name: os.path.join(folder, 'memory_{}_{}.npy'.format(role, name)) for name in memory.arrays})
+            for key, value in list(memory.items()):
+                if isinstance(value, np.ndarray):
+                    np.save(os.path.join(folder, 'memory_{}_{}.npy'.format(role, key)), value)
+                    memory[key] = None
+        torch.save(state, os.path.join(folder, 'state.pt'))
+
+        # Only now the snapshot is complete and may become the latest one
+        latest = os.path.join(self.snapshot_folder, 'latest{}.json'.format(self.suffix))
+        with open(latest + '.tmp', 'w') as f:
+            json.dump({'name': name, 'n_games': n_games}, f)
+        os.replace(latest + '.tmp', latest)
+
+        if folder not in self.snapshots:
+            self.snapshots.append(folder)
+        while len(self.snapshots) > self.keep_snapshots:
+            shutil.rmtree(self.snapshots.popleft(), ignore_errors=True)
+
+    @staticmethod
+    def remove(paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                write, args = job
+                if self.error is None:
+                    write(*args)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.jobs.task_done()
+
+    def check(self):
+        # A failed write shows up in the training loop with the next save instead of being lost in the thread
+        if self.error is not None:
+            raise RuntimeError('Writing a checkpoint failed') from self.error
+
+    def flush(self):
+        # Waits until everything queued so far is on disk
+        self.jobs.join()
+        self.check()
+
+    def close(self):
+        self.jobs.put(None)
+        self.thread.join()
+        self.check()
+
+
+def load_snapshot(suffix='', snapshot_folder='./snapshots'):
+    # The latest complete snapshot saved with this suffix, None if there is none. The replay arrays are
+    # memory mapped, Agent memories copy them in with load_state_dict
+    latest = os.path.join(snapshot_folder, 'latest{}.json'.format(suffix))
+    if not os.path.exists(latest):
+        return None
+
+    with open(latest) as f:
+        folder = os.path.join(snapshot_folder, json.load(f)['name'])
+    state = torch.load(os.path.join(folder, 'state.pt'), weights_only=False)
+
+    for role, agent_state in state['agents'].items():
+        memory = agent_state['memory']
+        for key, value in memory.items():
+            path = os.path.join(folder, 'memory_{}_{}.npy'.format(role, key))
+            if value is None and os.path.exists(path):
+                memory[key] = np.load(path, mmap_mode='r')
+
+    return state
+
+
+def restore_snapshot(state, agents):
+    # Puts the agents (role -> Agent) and the random generators back to where the snapshot was taken
+    for role, agent in agents.items():
+        agent_state = state['agents'][role]
+        agent.model.load_state_dict(agent_state['model'])
+        agent.trainer.optimizer.load_state_dict(agent_state['optimizer'])
+        agent.memory.load_state_dict(agent_state['memory'])
+        agent.n_games = state['n_games']
+
+    python_state, numpy_state, torch_state = state['random']
+    random.setstate(python_state)
+    np.random.set_state(numpy_state)
+    torch.set_rng_state(torch_state)
@@ -0,0 +1,190 @@
+import os
+import queue
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from agent import Agent
+from model import Linear_QNet, stacked_forward
+from vec_game import VecGame, N_PLAYERS, STATE_SIZE, HIDERS_WON
+
+# Actor / learner training. K rollout worker processes each step their own VecGame with a recent copy of
+# the four policies and stream the transitions over a queue to the learner process, which owns the Agents
+# (replay memories and QTrainers) and publishes new weights through shared memory after its updates.
+#
+# Workers never wait on the learner: they act with whatever weights were published last, so simulation and
+# inference scale with the number of processes while the learner only trains
+
+ROLES = ('ha', 'hb', 'sa', 'sb')  # Same order as the VecGame player slots
+N_ACTIONS = 5
+
+
+def rollout_worker(worker_id, policies, version, n_games, lock, transitions, stop, envs_per_worker,
+                   chunk_steps, situated, seed):
+    # The learner and the other workers already use the other cores
+    torch.set_num_threads(1)
+    rng = np.random.default_rng(seed)
+
+    env = VecGame(envs_per_worker, situated)
+    models = [Linear_QNet(STATE_SIZE, 256, N_ACTIONS) for _ in ROLES]
+    local_version = -1
+
+    # Per game totals, sent along with the chunk they ended in
+    team_rewards = np.zeros((envs_per_worker, 2))
+
+    obs = env.reset()
+    while not stop.is_set():
+        # Pick up the newest weights, if any were published since the last chunk
+        if version.value != local_version:
+            with lock:
+                for model, policy in zip(models, policies):
+                    model.load_state_dict(policy.state_dict())
+                local_version = version.value
+        epsilon = 80 - n_games.value
+
+        states = np.empty((chunk_steps, envs_per_worker, N_PLAYERS, STATE_SIZE), dtype=np.int8)
+        actions = np.empty((chunk_steps, envs_per_worker, N_PLAYERS), dtype=np.int64)
+        rewards = np.empty((chunk_steps, envs_per_worker, N_PLAYERS), dtype=np.float32)
+        next_states = np.empty_like(states)
+        dones = np.empty((chunk_steps, envs_per_worker), dtype=bool)
+        episodes = []
+
+        for t in range(chunk_steps):
+            # Greedy actions for every player of every game in one batched forward
+            with torch.no_grad():
+                action = stacked_forward(models, torch.from_numpy(obs.astype(np.float32))).argmax(dim=-1).numpy()
+
+            # Same exploration as Agent.get_action, drawn for every player independently
+            explore = rng.integers(0, 201, size=action.shape) < epsilon
+            action = np.where(explore, rng.integers(0, N_ACTIONS, size=action.shape), action)
+
+            new_obs, reward, done, winners = env.step(action)
+
+            states[t] = obs
+            actions[t] = action
+            rewards[t] = reward
+            # A finished game was reset already, the terminal observation is the real next state
+            next_states[t] = np.where(done[:, None, None], env.final_obs, new_obs)
+            dones[t] = done
+
+            team_rewards[:, 0] += reward[:, 0]
+            team_rewards[:, 1] += reward[:, 2]
+            for i in np.flatnonzero(done):
+                interactions = env.final_interaction_times[i]
+                episodes.append(('hiders' if winners[i] == HIDERS_WON else 'seekers',
+                                 team_rewards[i, 0], team_rewards[i, 1],
+                                 interactions[0] + interactions[1], interactions[2] + interactions[3]))
+            team_rewards[done] = 0
+
+            obs = new_obs
+
+        chunk = (worker_id, local_version, states, actions, rewards, next_states, dones, episodes)
+        while not stop.is_set():
+            try:
+                transitions.put(chunk, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+def publish(agents, policies, version, lock):
+    with lock:
+        for agent, policy in zip(agents, policies):
+            policy.load_state_dict(agent.model.state_dict())
+        version.value += 1
+
+
+def train_distributed(n_workers=None, envs_per_worker=8, chunk_steps=64, updates_per_chunk=1, n_episodes=2000,
+                      situated=True, prioritized=False, file_name='_distributed'):
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 2) - 1)  # One core stays with the learner
+
+    ctx = mp.get_context('spawn')
+    agents = [Agent(prioritized) for _ in ROLES]
+    policies = [Linear_QNet(STATE_SIZE, 256, N_ACTIONS) for _ in ROLES]
+    for policy in policies:
+        policy.share_memory()
+
+    version = ctx.Value('l', 0, lock=False)
+    n_games = ctx.Value('l', 0, lock=False)
+    lock = ctx.Lock()
+    publish(agents, policies, version, lock)
+
+    # Bounded, so the workers slow down instead of filling the memory if the learner falls behind
+    transitions = ctx.Queue(maxsize=4 * n_workers)
+    stop = ctx.Event()
+
+    workers = []
+    for worker_id in range(n_workers):
+        worker = ctx.Process(target=rollout_worker,
+                             args=(worker_id, policies, version, n_games, lock, transitions, stop,
+                                   envs_per_worker, chunk_steps, situated, worker_id + int(time.time())),
+                             daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    round_winners = {'hiders': 0, 'seekers': 0}
+    hider_rewards, seeker_rewards = [], []
+    hiders_interaction_times, seekers_interaction_times = [], []
+    steps = 0
+    start = time.perf_counter()
+
+    try:
+        while len(hider_rewards) < n_episodes:
+            try:
+                chunk = transitions.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError('All rollout workers exited')
+                continue
+            worker_id, policy_version, states, actions, rewards, next_states, dones, episodes = chunk
+
+            # Each role learns from its own column of every game in the chunk
+            for p, agent in enumerate(agents):
+                agent.memory.push_batch(states[:, :, p].reshape(-1, STATE_SIZE),
+                                        np.eye(N_ACTIONS, dtype=np.int64)[actions[:, :, p].reshape(-1)],
+                                        rewards[:, :, p].reshape(-1),
+                                        next_states[:, :, p].reshape(-1, STATE_SIZE),
+                                        dones.reshape(-1))
+            steps += dones.size
+
+            for winner, r_hiders, r_seekers, i_hiders, i_seekers in episodes:
+                round_winners[winner] += 1
+                hider_rewards.append(r_hiders)
+                seeker_rewards.append(r_seekers)
+                hiders_interaction_times.append(i_hiders)
+                seekers_interaction_times.append(i_seekers)
+
+            for agent in agents:
+                agent.n_games = len(hider_rewards)
+            n_games.value = len(hider_rewards)
+
+            for _ in range(updates_per_chunk):
+                for agent in agents:
+                    agent.train_long_memory()
+            publish(agents, policies, version, lock)
+
+            if episodes:
+                print('Games', len(hider_rewards), 'Round Winners: {}'.format(round_winners),
+                      'Steps/s: {:.0f}'.format(steps / (time.perf_counter() - start)))
+    finally:
+        stop.set()
+        # Drain the queue so workers blocked on put can see the stop event and exit
+        while any(worker.is_alive() for worker in workers):
+            try:
+                transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            for worker in workers:
+                worker.join(timeout=0.1)
+
+    for role, agent in zip(ROLES, agents):
+        agent.model.save('model_{}{}.pth'.format(role, file_name))
+
+    return {'round_winners': round_winners, 'hider_rewards': hider_rewards, 'seeker_rewards': seeker_rewards,
+            'hiders_interaction': hiders_interaction_times, 'seekers_interaction': seekers_interaction_times,
+            'steps': steps, 'seconds': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    train_distributed()
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+from hide_seek import Game
+from vec_game import VecGame, winner_names, HIDERS_WON, SEEKERS_WON, NO_WINNER
+
+# Golden trajectories: seeded action sequences played on the reference Game, with what it returned every
+# tick, so any other engine (VecGame, a faster FOV, new collision code...) can be replayed on the same
+# actions and diffed tick by tick. A trajectory is one compressed .npz:
+#
+#   actions            (T, 4) int8    index of the 1 in every player's one hot action, in Game.tick order
+#   obs                (T, 4, 15) int8  observations after the tick (game.obs), before a game over reset
+#   rewards            (T, 2) int8    hiders, seekers
+#   winners            (T,) int8      NO_WINNER, HIDERS_WON or SEEKERS_WON; a game over resets the game
+#   counters           (T,) float64   Game.counter after the tick
+#   interaction_times  (T, 4) int32
+#   positions          (T, 4, 2) int16  topleft of every player
+#   meta               JSON: seed, situated, chase, ticks
+#
+#   python golden.py record golden/regular.npz --seed 0
+#   python golden.py check golden/*.npz --engine vec
+
+WINNER_CODES = {None: NO_WINNER, 'hiders': HIDERS_WON, 'seekers': SEEKERS_WON}
+FIELDS = ('obs', 'rewards', 'winners', 'counters', 'interaction_times', 'positions')
+
+
+class GameEngine:
+    # The reference implementation
+
+    def __init__(self, situated):
+        self.situated = situated
+        self.game = Game(render=False)
+        self.players = [self.game.hider_a, self.game.hider_b, self.game.seeker_a, self.game.seeker_b]
+
+    def step(self, actions):
+        # Returns a dict with the FIELDS of one tick, the game is reset after a game over
+        one_hot = np.eye(5, dtype=int)[actions].tolist()
+        game_over, reward_seekers, reward_hiders, winner = self.game.tick(*one_hot, self.situated)
+        tick = {'obs': self.game.obs.copy(), 'rewards': (reward_hiders, reward_seekers),
+                'winners': WINNER_CODES[winner], 'counters': self.game.counter,
+                'interaction_times': [player.interaction_times for player in self.players],
+                'positions': [player.rect.topleft for player in self.players]}
+        if game_over:
+            self.game.reset()
+
+        return tick
+
+
+class VecGameEngine:
+    # One VecGame arena. It resets finished games inside step, so the counter and the positions of a game over
+    # tick are gone and left out of the diff (None)
+
+    def __init__(self, situated):
+        self.env = VecGame(1, situated)
+
+    def step(self, actions):
+        obs, rewards, dones, winners = self.env.step(np.asarray(actions)[None])
+        done = bool(dones[0])
+
+        return {'obs': self.env.final_obs[0] if done else obs[0], 'rewards': (rewards[0, 0], rewards[0, 2]),
+                'winners': int(winners[0]), 'counters': None if done else self.env.counter[0],
+                'interaction_times': self.env.final_interaction_times[0] if done else self.env.interaction_times[0],
+                'positions': None if done else self.env.pos[0]}
+
+
+ENGINES = {'game': GameEngine, 'vec': VecGameEngine}
+
+
+def choose_actions(game, rng, chase):
+    # Random actions, but a seeker chases the nearest hider with probability chase, so games also end with
+    # catches and not only when the time runs out
+    actions = rng.choice([0, 1, 2, 3, 4, 4], size=4)
+    for i, seeker in ((2, game.seeker_a), (3, game.seeker_b)):
+        if len(game.hiders_group) and rng.random() < chase:
+            actions[i] = game.direction_to_near_hider(seeker) - 1
+
+    return actions
+
+
+def record(path, ticks=5000, seed=0, situated=False, chase=0.6):
+    rng = np.random.default_rng(seed)
+    engine = GameEngine(situated)
+    actions = np.zeros((ticks, 4), dtype=np.int8)
+    columns = {field: [] for field in FIELDS}
+
+    for t in range(ticks):
+        actions[t] = choose_actions(engine.game, rng, chase)
+        for field, value in engine.step(actions[t]).items():
+            columns[field].append(value)
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    meta = {'seed': seed, 'situated': situated, 'chase': chase, 'ticks': ticks}
+    np.savez_compressed(path, actions=actions,
+                        obs=np.array(columns['obs'], dtype=np.int8),
+                        rewards=np.array(columns['rewards'], dtype=np.int8),
+                        winners=np.array(columns['winners'], dtype=np.int8),
+                        counters=np.array(columns['counters'], dtype=np.float64),
+                        interaction_times=np.array(columns['interaction_times'], dtype=np.int32),
+                        positions=np.array(columns['positions'], dtype=np.int16),
+                        meta=json.dumps(meta))
+
+    return meta
+
+
+def diff(path, engine_class, max_mismatches=1):
+    # Replays the actions of the trajectory on engine_class(situated) and returns the mismatches as
+    # (tick, field, expected, got), up to max_mismatches ticks. Once an engine diverged every later tick
+    # usually differs too, so by default only the first one is reported
+    golden = np.load(path)
+    meta = json.loads(str(golden['meta']))
+    engine = engine_class(meta['situated'])
+    mismatches = []
+    bad_ticks = 0
+
+    for t, actions in enumerate(golden['actions'].astype(np.int64)):
+        tick = engine.step(actions)
+        bad = False
+        for field in FIELDS:
+            got = tick[field]
+            expected = golden[field][t]
+            if got is None:
+                continue
+            # The counter is a float that loses 0.10 a tick, it has to follow the same rounding
+            if not np.array_equal(np.asarray(got, dtype=expected.dtype), expected):
+                mismatches.append((t, field, expected, np.asarray(got)))
+                bad = True
+        if bad:
+            bad_ticks += 1
+            if bad_ticks >= max_mismatches:
+                break
+
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python golden.py', description='Golden trajectories of Game')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='record a trajectory of the reference Game')
+    record_parser.add_argument('path')
+    record_parser.add_argument('--ticks', type=int, default=5000)
+    record_parser.add_argument('--seed', type=int, default=0)
+    record_parser.add_argument('--situated', action='store_true')
+    record_parser.add_argument('--chase', type=float, default=0.6)
+
+    check_parser = commands.add_parser('check', help='replay trajectories on an engine and diff them')
+    check_parser.add_argument('paths', nargs='+')
+    check_parser.add_argument('--engine', choices=sorted(ENGINES), default='game')
+    check_parser.add_argument('--max-mismatches', type=int, default=1)
+
+    args = parser.parse_args(argv)
+    if args.command == 'record':
+        meta = record(args.path, args.ticks, args.seed, args.situated, args.chase)
+        golden = np.load(args.path)
+        print('Recorded {} ticks, {} games over ({})'.format(
+            meta['ticks'], int((golden['winners'] != NO_WINNER).sum()),
+            ', '.join('{} {}'.format(winner_names[code], int((golden['winners'] == code).sum()))
+                      for code in (HIDERS_WON, SEEKERS_WON))))
+        return 0
+
+    failed = 0
+    for path in args.paths:
+        mismatches = diff(path, ENGINES[args.engine], args.max_mismatches)
+        print('{}: {}'.format(path, 'identical' if not mismatches else 'DIFFERS'))
+        for t, field, expected, got in mismatches:
+            print('  tick {} {}:\n    expected {}\n    got      {}'.format(t, field, expected.tolist(), got.tolist()))
+        failed += bool(mismatches)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,14 @@
 import pygame
+import os
 import sys
 import random
+import functools
+import numpy as np
 
-from plot_helper import save_to_csv, plot_rewards, save_dict_to_csv
-
-pygame.init()
+import profiling
+from raycast import line_rects, cast_rays
+from spatial_hash import IndexedGroup
+from plot_helper import plot_rewards, MetricsWriter
 
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
@@ -42,6 +46,7 @@ FOV_length = 500
 FOV_lines_number = 10
 FOV_step = int(FOV_length/FOV_lines_number)
 FOV_start_stop = int(FOV_length/2)
+FOV_offsets = np.arange(-FOV_start_stop, FOV_start_stop, FOV_step)
 
 fov_encode_map = {
     '_': EMPTY_FOV,
@@ -52,6 +57,12 @@ fov_encode_map = {
     'S' : SEEKER_FOV
 }
 
+# Observation of a player, int8: direction one hot (LEFT, RIGHT, UP, DOWN), grabbed object, encoded rays
+OBS_DIRECTION = slice(0, 4)
+OBS_GRABBED = 4
+OBS_FOV = slice(5, 5 + FOV_lines_number)
+STATE_SIZE = 5 + FOV_lines_number
+
 direction_plus_values = {
     LEFT: (-FOV_length, 0),
     RIGHT: (FOV_length, 0),
@@ -108,24 +119,113 @@ direction_move_map = {
 # [0, 0, 0, 1, 0] DOWN
 # [0, 0, 0, 0, 1] GRAB/RELEASE
 
-# game_over = False
-# Define the fonts
-font = pygame.font.Font('Arial.ttf', 36)
-
 DEBUG = True
 HEURISTICS = False
 
-screen = pygame.display.set_mode((WINDOW_W, WINDOW_H))
+# The window and the font are only created once a rendered Game needs them,
+# so importing this module (and running headless) never touches the display
+font = None
+screen = None
+
+# Decoded images by file name, every sprite of a kind shares one Surface and the files are read once
+images = {}
+
+# Images and the font are next to this file, so a Game can be created from any working directory
+ASSETS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def init_display():
+    global screen
+    if screen is None:
+        pygame.init()
+        init_font()
+        screen = pygame.display.set_mode((WINDOW_W, WINDOW_H))
+
+    return screen
+
+
+def init_font():
+    # Also needed when the Game draws on a screen it was given instead of the one of init_display
+    global font
+    if font is None:
+        pygame.font.init()
+        # Define the fonts
+        font = pygame.font.Font(os.path.join(ASSETS_DIR, 'Arial.ttf'), 36)
+
+    return font
+
+
+def load_image(file_name):
+    if file_name not in images:
+        images[file_name] = pygame.image.load(os.path.join(ASSETS_DIR, file_name))
+
+    return images[file_name]
+
+
+def fov_rays(x, y, w, h, direction):
+    # Rays of players with rect (x, y, w, h) looking in direction, shape (..., FOV_lines_number, 4).
+    # These are the exact Rects pygame.draw.line returns in draw_fov, computed without a surface
+    x, y, w, h, direction = (np.asarray(v, dtype=np.int64) for v in (x, y, w, h, direction))
+    horizontal = (direction == LEFT) | (direction == RIGHT)
+
+    start_x = np.select([direction == LEFT, direction == RIGHT], [x - 1, x + w], x + w // 2)
+    start_y = np.select([direction == UP, direction == DOWN], [y - 1, y + h], y + h // 2)
+    end_x = start_x + np.select([direction == LEFT, direction == RIGHT], [-FOV_length, FOV_length], 0)
+    end_y = start_y + np.select([direction == UP, direction == DOWN], [-FOV_length, FOV_length], 0)
+
+    # Spread the rays over the axis perpendicular to the looking direction
+    end_x = end_x[..., None] + np.where(horizontal[..., None], 0, FOV_offsets)
+    end_y = end_y[..., None] + np.where(horizontal[..., None], FOV_offsets, 0)
+
+    return line_rects(start_x[..., None], start_y[..., None], end_x, end_y, WINDOW_W, WINDOW_H)
+
+
+@functools.lru_cache(maxsize=65536)
+def player_fov_rays(x, y, w, h, direction):
+    # The rays only depend on the player rect and direction, players keep coming back to the same spots
+    rays = fov_rays(x, y, w, h, direction)
+    rays.flags.writeable = False
+
+    return rays
+
+
+@functools.lru_cache(maxsize=65536)
+def player_fov_rects(x, y, w, h, direction):
+    # The same rays as pygame Rects, for testing a few of them at a time
+    return tuple(pygame.Rect(*ray) for ray in player_fov_rays(x, y, w, h, direction))
+
+
+def fov_codes_from_rays(rays, direction, obj_rects, obj_codes, obj_valid=None):
+    # Encoded FOV (..., FOV_lines_number) of players looking in direction along rays (..., FOV_lines_number, 4)
+    # at objects (..., M, 4) with codes (M,). Game.cast_ray does the same for one ray, VecGame for all arenas
+    direction = np.asarray(direction)
+    obj_rects = np.asarray(obj_rects)
+    horizontal = (direction == LEFT) | (direction == RIGHT)
+
+    # Objects are sorted by their x when looking left/right and by their y otherwise,
+    # the closest is the smallest for RIGHT/DOWN and the largest for LEFT/UP
+    keys = np.where(horizontal[..., None], obj_rects[..., 0], obj_rects[..., 1])
+    forward = (direction == RIGHT) | (direction == DOWN)
+
+    return cast_rays(rays, keys, forward, obj_rects, obj_codes, obj_valid)
 
 
 class Game:
-    def __init__(self, screen):
-        # Init the game window
-        self.screen = screen
-        self.clock = pygame.time.Clock()
-        pygame.display.set_caption('Hide&Seek')
+    def __init__(self, screen=None, render=True):
+        self.render = render
+        if render:
+            # Init the game window
+            self.screen = screen if screen is not None else init_display()
+            init_font()
+            self.clock = pygame.time.Clock()
+            pygame.display.set_caption('Hide&Seek')
+            pygame.time.set_timer(pygame.USEREVENT, 1000)
+        else:
+            # Headless: no display, events, font or clock
+            self.screen = None
+            self.clock = None
+
         self.counter, self.text = 60, '60'.rjust(3)
-        pygame.time.set_timer(pygame.USEREVENT, 1000)
 
         # Create the hiders
         self.hider_a, self.hider_b, self.hiders_group = self.generate_hiders()
@@ -138,10 +238,79 @@ class Game:
         self.crates_group = self.generate_crates()
         self.hammers_group = self.generate_hammers()
 
+        # Observations of hider a, hider b, seeker a and seeker b, the players write into their own row
+        self.players = [self.hider_a, self.hider_b, self.seeker_a, self.seeker_b]
+        self.obs = np.zeros((len(self.players), STATE_SIZE), dtype=np.int8)
+        for player, obs in zip(self.players, self.obs):
+            player.use_obs(obs)
+        self.update_obs()
+
+        # Everything that can leave its group during a round, in the original group order for reset
+        self.walls = self.walls_group.sprites()
+        self.crates = self.crates_group.sprites()
+        self.hammers = self.hammers_group.sprites()
+
+        # Players only hold the rect of what they grabbed, this finds the sprite to update in the index
+        self.rect_owners = {id(sprite.rect): sprite for sprite in self.crates + self.hammers}
+
+        # FOV of every player from the last time it was cast. Anything a ray can hit that moves, appears or
+        # disappears leaves its old and new rects in fov_dirty, only the rays crossing those are cast again
+        self.fov_cache = {}  # player -> ((x, y, w, h, direction), encoded FOV)
+        self.fov_dirty = []
+        self.fov_hits = 0  # Rays taken from the cache
+        self.fov_misses = 0  # Rays cast
+
+    @profiling.profiled('tick')
     def tick(self, action_ha=None, action_hb=None, action_sa=None, action_sb=None, situated=False):
         g_over = False
         winner = None
 
+        if self.render:
+            with profiling.phase('tick.events'):
+                self.handle_events()
+
+        self.counter -= 0.10
+        self.text = str(int(self.counter)).rjust(3)
+
+        with profiling.phase('tick.move'):
+            # Perform passed action, hiders and seekers
+            self.move_hiders(action_ha, action_hb, situated)
+            # Only move the seekers if the 10 seconds have passed
+            if self.counter <= 50: self.move_seekers(action_sa, action_sb, situated)
+
+        with profiling.phase('tick.fov'):
+            seeker_a_fov, seeker_b_fov, hider_a_fov, hider_b_fov = self.get_all_fov()
+
+        with profiling.phase('tick.reward'):
+            reward_hiders, reward_seekers = self.get_reward(seeker_a_fov, seeker_b_fov)
+
+        with profiling.phase('tick.collisions'):
+            self.check_player_collisions()
+            self.check_hammer_wall_collisions()
+
+        self.update_obs()
+
+        # Check Game over
+        if self.counter <= 0:
+            winner = 'hiders'
+            g_over = True
+
+        if len(self.hiders_group) <= 0:
+            winner = 'seekers'
+            g_over = True
+
+        # print(self.direction_to_near_hider(self.seeker_a))
+        if self.render:
+            # Update the screen
+            with profiling.phase('tick.flip'):
+                self.screen.blit(font.render(self.text, True, WHITE), (535, 10))
+                pygame.display.flip()  # update
+            with profiling.phase('tick.clock'):
+                self.clock.tick(100)
+
+        return g_over, reward_seekers, reward_hiders, winner
+
+    def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -157,12 +326,8 @@ class Game:
                 if event.key in key_move_map.keys():
                     # Get the correct button press action and translate into move
                     move = key_move_map[event.key]
-                    # Move the player
-                    player.move(move)
-                    # Check if collision occurred, if so move the player back
-                    if self.check_unit_wall_collision(player) or \
-                            self.check_unit_crate_collision(player):
-                        player.move(opposite_move_map[move], moved_back=True)
+                    # Move the player, and back if a collision occurred
+                    self.move_unit(player, move)
 
                 elif event.key == pygame.K_SPACE:
                     crate = self.crates_group.sprites()[0]
@@ -179,7 +344,7 @@ class Game:
 
                     elif self.check_grab_proximity(player, hammer):
                         if player in self.hiders_group:
-                            self.hammers_group.remove(hammer)
+                            self.remove_object(self.hammers_group, hammer)
 
                 elif event.key == pygame.K_z:
                     hammer = self.hammers_group.sprites()[0]
@@ -193,51 +358,67 @@ class Game:
 
                         #print(self.seeker_a.grabbed_hammer, self.seeker_a.hammer_rect)
 
-        self.counter -= 0.10
-        self.text = str(int(self.counter)).rjust(3)
-
-        # Perform passed action, hiders and seekers
-        self.move_hiders(action_ha, action_hb, situated)
-        # Only move the seekers if the 10 seconds have passed
-        if self.counter <= 50: self.move_seekers(action_sa, action_sb, situated)
-
-        seeker_a_fov, seeker_b_fov, hider_a_fov, hider_b_fov = self.get_all_fov()
-
-        reward_hiders, reward_seekers = self.get_reward(seeker_a_fov, seeker_b_fov)
-
-        self.check_player_collisions()
-        self.check_hammer_wall_collisions()
-
-        # Check Game over
-        if self.counter <= 0:
-            winner = 'hiders'
-            g_over = True
-
-        if len(self.hiders_group) <= 0:
-            winner = 'seekers'
-            g_over = True
-
-        # print(self.direction_to_near_hider(self.seeker_a))
-        # Update the screen
-        self.screen.blit(font.render(self.text, True, WHITE), (535, 10))
-        pygame.display.flip()  # update
-        self.clock.tick(100)
-
-        return g_over, reward_seekers, reward_hiders, winner
-
     def reset(self):
         self.counter, self.text = 60, '60'.rjust(3)
 
-        # Create the hiders
-        self.hider_a, self.hider_b, self.hiders_group = self.generate_hiders()
-
-        # Create the seekers
-        self.seeker_a, self.seeker_b, self.seekers_group = self.generate_seekers()
-
-        # Generate game objects
-        self.walls_group = self.generate_walls()
-        self.crates_group = self.generate_crates()
-        self.hammers_group = self.generate_hammers()
+        # Put every sprite back to where it started instead of creating new ones
+        for sprite in [self.hider_a, self.hider_b, self.seeker_a, self.seeker_b] + self.crates + self.hammers:
+            sprite.reset()
+
+        # Caught hiders, destroyed walls and taken hammers rejoin their groups (in the same order as before,
+        # collisions and the FOV go through the groups in that order)
+        for group, sprites in ((self.hiders_group, [self.hider_a, self.hider_b]),
+                               (self.seekers_group, [self.seeker_a, self.seeker_b]),
+                               (self.walls_group, self.walls),
+                               (self.crates_group, self.crates),
+                               (self.hammers_group, self.hammers)):
+            group.empty()
+            group.add(*sprites)
+
+        self.fov_cache.clear()
+        self.fov_dirty = []
+        self.update_obs()
+
+    def update_obs(self):
+        # Direction and grab state of every player, get_all_fov writes the rays
+        obs = self.obs
+        obs[:, OBS_DIRECTION] = 0
+        obs[range(len(self.players)), [player.direction - 1 for player in self.players]] = 1
+        obs[:, OBS_GRABBED] = [player.grabbed_obj for player in self.players]
+
+    def mark_fov_dirty(self, *rects):
+        self.fov_dirty.extend(pygame.Rect(rect) for rect in rects)
+
+    def remove_object(self, group, sprite):
+        # Take a caught hider, a picked up hammer or a destroyed wall out of the game
+        group.remove(sprite)
+        self.mark_fov_dirty(sprite.rect)
+
+    def move_unit(self, unit, move, situated=False):
+        # Move a player, and move it back if it ran into a wall or a crate
+        rects = [unit.rect, unit.obj_rect] if unit.grabbed_obj else [unit.rect]
+        old_rects = [tuple(rect) for rect in rects]
+
+        unit.move(move, situated=situated)
+        self.update_index(unit)
+        if self.check_unit_wall_collision(unit) or self.check_unit_crate_collision(unit):
+            unit.move(opposite_move_map[move], moved_back=True, situated=situated)
+            self.update_index(unit)
+
+        # A move that was undone leaves the FOV of the others as it was
+        for old_rect, rect in zip(old_rects, rects):
+            if tuple(rect) != old_rect:
+                self.mark_fov_dirty(old_rect, rect)
+
+    def update_index(self, unit):
+        # Tell the groups of the player (and of the object it drags along) that it moved
+        for group in unit.groups():
+            group.moved(unit)
+
+        if unit.grabbed_obj:
+            obj = self.rect_owners[id(unit.obj_rect)]
+            for group in obj.groups():
+                group.moved(obj)
 
     def move_seekers(self, action_space_a, action_space_b, situated):
         try:
@@ -255,34 +436,26 @@ class Game:
         # Move the seekers
         if self.seeker_a in self.seekers_group:
             if seeker_a_action <= 4:
-                self.seeker_a.move(seeker_a_action, situated=situated)
-                if self.check_unit_wall_collision(self.seeker_a) or \
-                        self.check_unit_crate_collision(self.seeker_a):
-                    self.seeker_a.move(opposite_move_map[seeker_a_action], moved_back=True, situated=situated)
+                self.move_unit(self.seeker_a, seeker_a_action, situated)
             else: # [0, 0, 0, 0, 1] = Grab/Release
-                for hammer in self.hammers_group:
-                    if self.check_grab_proximity(self.seeker_a, hammer):
-                        # Invert the boolean (True -> False, False -> True)
-                        if not self.seeker_a.grabbed_obj:
-                            self.seeker_a.grab_object(hammer.rect)
-                        else:
-                            self.seeker_a.release_object()
+                for hammer in self.hammers_group.near(self.seeker_a, 15, self.check_grab_proximity):
+                    # Invert the boolean (True -> False, False -> True)
+                    if not self.seeker_a.grabbed_obj:
+                        self.seeker_a.grab_object(hammer.rect)
+                    else:
+                        self.seeker_a.release_object()
 
         # Move the seekers
         if self.seeker_b in self.seekers_group:
             if seeker_b_action <= 4:
-                self.seeker_b.move(seeker_b_action, situated=situated)
-                if self.check_unit_wall_collision(self.seeker_b) or \
-                        self.check_unit_crate_collision(self.seeker_b):
-                    self.seeker_b.move(opposite_move_map[seeker_b_action], moved_back=True, situated=situated)
+                self.move_unit(self.seeker_b, seeker_b_action, situated)
             else: # [0, 0, 0, 0, 1] = Grab/Release
-                for hammer in self.hammers_group:
-                    if self.check_grab_proximity(self.seeker_b, hammer):
-                        # Invert the boolean (True -> False, False -> True)
-                        if not self.seeker_b.grabbed_obj:
-                            self.seeker_b.grab_object(hammer.rect)
-                        else:
-                            self.seeker_b.release_object()
+                for hammer in self.hammers_group.near(self.seeker_b, 15, self.check_grab_proximity):
+                    # Invert the boolean (True -> False, False -> True)
+                    if not self.seeker_b.grabbed_obj:
+                        self.seeker_b.grab_object(hammer.rect)
+                    else:
+                        self.seeker_b.release_object()
 
     def move_hiders(self, action_hider_a, action_hider_b, situated=False):
         try:
@@ -300,72 +473,113 @@ class Game:
 
         # Move the hiders
         if hider_a_action <= 4:
-            self.hider_a.move(hider_a_action, situated=situated)
-            if self.check_unit_wall_collision(self.hider_a) or \
-                    self.check_unit_crate_collision(self.hider_a):
-                self.hider_a.move(opposite_move_map[hider_a_action], moved_back=True, situated=situated)
+            self.move_unit(self.hider_a, hider_a_action, situated)
         else: # [0, 0, 0, 0, 1] = Grab/Release
-            for hammer in self.hammers_group:
-                if self.check_grab_proximity(self.hider_a, hammer):
-                    self.hider_a.interaction_times +=1
-                    self.hammers_group.remove(hammer)
+            for hammer in self.hammers_group.near(self.hider_a, 15, self.check_grab_proximity):
+                self.hider_a.interaction_times +=1
+                self.remove_object(self.hammers_group, hammer)
 
-            for crate in self.crates_group:
-                if self.check_grab_proximity(self.hider_a, crate):
-                    # Invert the boolean (True -> False, False -> True)
-                    if not self.hider_a.grabbed_obj:
-                        self.hider_a.grab_obj(crate.rect)
-                    else:
-                        self.hider_a.release_obj()
+            for crate in self.crates_group.near(self.hider_a, 15, self.check_grab_proximity):
+                # Invert the boolean (True -> False, False -> True)
+                if not self.hider_a.grabbed_obj:
+                    self.hider_a.grab_obj(crate.rect)
+                else:
+                    self.hider_a.release_obj()
 
         if hider_b_action <= 4:
-            self.hider_b.move(hider_b_action, situated=situated)
-            if self.check_unit_wall_collision(self.hider_b) or \
-                    self.check_unit_crate_collision(self.hider_b):
-                self.hider_b.move(opposite_move_map[hider_b_action], moved_back=True, situated=situated)
+            self.move_unit(self.hider_b, hider_b_action, situated)
         else:  # [0, 0, 0, 0, 1] = Grab/Release
-            for hammer in self.hammers_group:
-                if self.check_grab_proximity(self.hider_b, hammer):
-                    self.hider_b.interaction_times +=1
-                    self.hammers_group.remove(hammer)
+            for hammer in self.hammers_group.near(self.hider_b, 15, self.check_grab_proximity):
+                self.hider_b.interaction_times +=1
+                self.remove_object(self.hammers_group, hammer)
 
-            for crate in self.crates_group:
-                if self.check_grab_proximity(self.hider_b, crate):
-                    # Invert the boolean (True -> False, False -> True)
-                    if not self.hider_b.grabbed_obj:
-                        self.hider_b.grab_obj(crate.rect)
-                    else:
-                        self.hider_b.release_obj()
+            for crate in self.crates_group.near(self.hider_b, 15, self.check_grab_proximity):
+                # Invert the boolean (True -> False, False -> True)
+                if not self.hider_b.grabbed_obj:
+                    self.hider_b.grab_obj(crate.rect)
+                else:
+                    self.hider_b.release_obj()
 
     def get_all_fov(self):
-        # Draw FOV of seekers and get encoded values for all rays
-        seeker_a_fov = self.draw_fov(self.seeker_a)
-        seeker_b_fov = self.draw_fov(self.seeker_b)
+        # Get encoded values for all rays of the seekers, and of the hiders that are still alive
+        players = [self.seeker_a, self.seeker_b]
+        players += [hider for hider in (self.hider_a, self.hider_b) if hider in self.hiders_group]
 
-        fov_seeker_a = self.check_fov(self.seeker_a.direction, seeker_a_fov)
-        fov_seeker_b = self.check_fov(self.seeker_b.direction, seeker_b_fov)
+        for player, fov in zip(players, self.cast_fov(players)):
+            player.fov[:] = fov
 
-        self.seeker_a.fov = fov_seeker_a
-        self.seeker_b.fov = fov_seeker_b
+            if self.render:
+                self.draw_fov(player)
 
-        # Draw FOV of hiders and get encoded values for all rays
         # Set to None, unless they are still alive
-        fov_hider_a, fov_hider_b = None, None
-        if self.hider_a in self.hiders_group:
-            hider_a_fov = self.draw_fov(self.hider_a)
-            fov_hider_a = self.check_fov(self.hider_a.direction, hider_a_fov)
-            self.hider_a.fov = fov_hider_a
-           # print(fov_hider_a)
-            #print(self.encode_fov(fov_hider_a))
+        fov_hider_a = self.hider_a.fov if self.hider_a in self.hiders_group else None
+        fov_hider_b = self.hider_b.fov if self.hider_b in self.hiders_group else None
+
+        return self.seeker_a.fov, self.seeker_b.fov, fov_hider_a, fov_hider_b
+
+    def cast_fov(self, players):
+        # Encoded FOV of the players, shape (len(players), FOV_lines_number). Rays are taken from the cache
+        # unless the player moved or turned, or something changed inside the ray since it was cast
+        dirty = self.fov_dirty
+        self.fov_dirty = []
+        objects = None
+
+        fovs = []
+        for player in players:
+            key = (*player.rect, player.direction)
+            rays = player_fov_rects(*key)
+            entry = self.fov_cache.get(player)
+            if entry is None or entry[0] != key:
+                fov = [EMPTY_FOV] * FOV_lines_number
+                stale = range(FOV_lines_number)
+            else:
+                fov = list(entry[1])
+                stale = {i for rect in dirty for i in rect.collidelistall(rays)}
+
+            if stale:
+                if objects is None:
+                    objects = [sprite.rect for group, _ in self.fov_groups() for sprite in group]
+                    codes = [code for group, code in self.fov_groups() for _ in group]
+                for i in stale:
+                    fov[i] = self.cast_ray(rays[i], player.direction, objects, codes)
 
-        if self.hider_b in self.hiders_group:
-            hider_b_fov = self.draw_fov(self.hider_b)
-            fov_hider_b = self.check_fov(self.hider_b.direction, hider_b_fov)
-            self.hider_b.fov = fov_hider_b
+            self.fov_misses += len(stale)
+            self.fov_hits += FOV_lines_number - len(stale)
+            self.fov_cache[player] = (key, fov)
+            fovs.append(fov)
 
-        return fov_seeker_a, fov_seeker_b, fov_hider_a, fov_hider_b
+        # Players that are not cast this time (caught hiders) only come back after a reset
+        if len(self.fov_cache) > len(players):
+            self.fov_cache = {player: self.fov_cache[player] for player in players}
+
+        return np.array(fovs)
+
+    @staticmethod
+    def cast_ray(ray, direction, objects, codes):
+        # Code of the nearest of objects the ray hits, like fov_codes_from_rays does for many rays at once
+        hits = ray.collidelistall(objects)
+        if not hits:
+            return EMPTY_FOV
+
+        axis = 0 if direction in (LEFT, RIGHT) else 1
+        forward = direction in (RIGHT, DOWN)
+        nearest = hits[0]
+        for i in hits[1:]:
+            # On equal keys the object that comes last wins
+            if (objects[i][axis] <= objects[nearest][axis]) if forward else \
+                    (objects[i][axis] >= objects[nearest][axis]):
+                nearest = i
+
+        return codes[nearest]
+
+    def fov_groups(self):
+        # Everything a ray can hit. The order matters: when two objects are equally close, the one that
+        # comes last is seen
+        return [(self.walls_group, WALL_FOV), (self.crates_group, CRATE_FOV), (self.hammers_group, HAMMER_FOV),
+                (self.hiders_group, HIDER_FOV), (self.seekers_group, SEEKER_FOV)]
 
     def draw_fov(self, player):
+        # Only draws the rays on the screen, the FOV itself is computed by cast_fov
         ray_start_xy_map = {
             LEFT: (player.rect.midleft[0] - 1, player.rect.midleft[1]),
             RIGHT: player.rect.midright,
@@ -377,68 +591,12 @@ class Game:
         add_values = direction_plus_values[player.direction]
         ray_direction = ray_start[0] + add_values[0], ray_start[1] + add_values[1]
 
-        player_fov = []
         for i in range(-FOV_start_stop, FOV_start_stop, FOV_step):
 
             if player.direction in (LEFT, RIGHT):
-                line = pygame.draw.line(self.screen, RED,
-                                        ray_start,
-                                        (ray_direction[0] + 0,
-                                         ray_direction[1] + i), 2)
+                pygame.draw.line(self.screen, RED, ray_start, (ray_direction[0] + 0, ray_direction[1] + i), 2)
             else:
-                line = pygame.draw.line(self.screen, RED,
-                                        ray_start,
-                                        (ray_direction[0] + i,
-                                         ray_direction[1] + 0), 2)
-            player_fov.append(line)
-
-        return player_fov
-
-    def check_fov(self, player_direction, player_fov):
-
-        encoded_fov = []
-        for line in player_fov:
-            collided_with = '_'
-            collided_with_dict = {}
-
-            # TODO: Simplify
-            for idx, wall in enumerate(self.walls_group):
-                if line.colliderect(wall):
-                    obj_id = 'W{}'.format(idx)
-                    collided_with_dict[self.check_axis(wall, player_direction)] = obj_id
-
-            for idx, crate in enumerate(self.crates_group):
-                if line.colliderect(crate):
-                    obj_id = 'C{}'.format(idx)
-                    collided_with_dict[self.check_axis(crate, player_direction)] = obj_id
-
-            for idx, hammer in enumerate(self.hammers_group):
-                if line.colliderect(hammer):
-                    obj_id = 'HM{}'.format(idx)
-                    collided_with_dict[self.check_axis(hammer, player_direction)] = obj_id
-
-            for idx, hider in enumerate(self.hiders_group):
-                if line.colliderect(hider):
-                    obj_id = 'HI{}'.format(idx)
-                    collided_with_dict[self.check_axis(hider, player_direction)] = obj_id
-
-            for idx, seeker in enumerate(self.seekers_group):
-                if line.colliderect(seeker):
-                    obj_id = 'S{}'.format(idx)
-                    collided_with_dict[self.check_axis(seeker, player_direction)] = obj_id
-
-            if not len(collided_with_dict) <= 0:
-                if player_direction in (RIGHT, DOWN):
-                    min_key = min(collided_with_dict)
-                    collided_with = collided_with_dict[min_key][:-1]
-
-                elif player_direction in (LEFT, UP):
-                    min_key = max(collided_with_dict)
-                    collided_with = collided_with_dict[min_key][:-1]
-
-            encoded_fov.append(collided_with)
-
-        return encoded_fov
+                pygame.draw.line(self.screen, RED, ray_start, (ray_direction[0] + i, ray_direction[1] + 0), 2)
 
     def get_reward(self, seeker_a_fov, seeker_b_fov):
         # Get the reward for both hiders and seekers
@@ -448,7 +606,7 @@ class Game:
         if self.counter > 50:
             reward_hiders, reward_seekers = 0, 0
 
-        elif 'HI' in seeker_a_fov or 'HI' in seeker_b_fov:
+        elif HIDER_FOV in seeker_a_fov or HIDER_FOV in seeker_b_fov:
             reward_hiders, reward_seekers = -1, 1
 
         return reward_hiders, reward_seekers
@@ -491,27 +649,6 @@ class Game:
             else:
                 return DOWN
 
-    @staticmethod
-    def encode_fov(fov):
-        encoded_fov = []
-
-        for item in fov:
-            encoded_fov.append(fov_encode_map[item])
-
-        return encoded_fov
-
-    @staticmethod
-    def check_axis(obj, player_direction):
-
-        position_to_xy = {
-            LEFT: obj.rect.x,
-            RIGHT: obj.rect.x,
-            UP: obj.rect.y,
-            DOWN: obj.rect.y
-        }
-
-        return position_to_xy[player_direction]
-
     @staticmethod
     def check_grab_proximity(player, obj):
         return (abs(obj.rect.midleft[0] - player.rect.midright[0]) <= 15 and
@@ -526,52 +663,38 @@ class Game:
     def check_player_collisions(self):
         # Check if seekers have caught hiders
         for seeker in self.seekers_group:
-            for hider in self.hiders_group:
-                if pygame.sprite.collide_rect(hider, seeker):
-                    # Remove caught hiders
-                    self.hiders_group.remove(hider)
+            for hider in self.hiders_group.colliding(seeker.rect):
+                # Remove caught hiders
+                self.remove_object(self.hiders_group, hider)
 
     def check_hammer_wall_collisions(self):
         # Remove the wal if hit by a hammer
         for hammer in self.hammers_group:
-            for wall in self.walls_group:
-                if pygame.sprite.collide_rect(hammer, wall):
-                    self.walls_group.remove(wall)
+            for wall in self.walls_group.colliding(hammer.rect):
+                self.remove_object(self.walls_group, wall)
 
     def check_unit_wall_collision(self, unit):
-        for wall in self.walls_group:
-            if pygame.sprite.collide_rect(unit, wall):
-                return True
-
-        return False
+        return self.walls_group.collides(unit.rect)
 
     def check_unit_crate_collision(self, unit):
-        for crate in self.crates_group:
-            if pygame.sprite.collide_rect(unit, crate):
-                return True
-
-        return False
+        return self.crates_group.collides(unit.rect)
 
     def check_crate_grab(self, unit):
-        for crate in self.crates_group:
-            if pygame.sprite.collide_rect(unit, crate):
-                return True
-
-        return False
+        return self.crates_group.collides(unit.rect)
 
     @staticmethod
     def generate_hiders():
         hider_a = Hider(400, 50)
         hider_b = Hider(400, 150)
 
-        return hider_a, hider_b, pygame.sprite.Group(hider_a, hider_b)
+        return hider_a, hider_b, IndexedGroup(block_size, hider_a, hider_b)
 
     @staticmethod
     def generate_seekers():
         seeker_a = Seeker(25, 50)
         seeker_b = Seeker(25, 150)
 
-        return seeker_a, seeker_b, pygame.sprite.Group(seeker_a, seeker_b)
+        return seeker_a, seeker_b, IndexedGroup(block_size, seeker_a, seeker_b)
 
     @staticmethod
     def generate_walls():
@@ -585,25 +708,25 @@ class Game:
         #wall7 = Wall(WHITE, WINDOW_W-block_size, 0, block_size, WINDOW_H)
         #wall8 = Wall(WHITE, 0, WINDOW_H-block_size, WINDOW_W, block_size)
 
-        return pygame.sprite.Group(wall1, wall2, wall3, wall4) #, wall5, wall6, wall7, wall8)
+        return IndexedGroup(block_size, wall1, wall2, wall3, wall4) #, wall5, wall6, wall7, wall8)
 
     @staticmethod
     def generate_crates():
         crate1 = Crate(280, 250)
         crate2 = Crate(550, 75)
 
-        return pygame.sprite.Group(crate1, crate2)
+        return IndexedGroup(block_size, crate1, crate2)
 
     @staticmethod
     def generate_hammers():
         hammer1 = Hammer(50, 350)
         hammer2 = Hammer(125, 150)
 
-        return pygame.sprite.Group(hammer1, hammer2)
+        return IndexedGroup(block_size, hammer1, hammer2)
 
     # Heuristics operations
     def get_state_heuristics_seeker(self, seeker):
-        if 'HI' in seeker.fov:
+        if HIDER_FOV in seeker.fov:
             return True, self.direction_to_near_hider(seeker) - 1
         else:
             return False, random.randint(0, 4) - 1  # random.randint(0, 4)
@@ -620,10 +743,12 @@ class Hider(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
 
-        self.image = pygame.image.load('png/hider_small.png')
+        self.image = load_image('png/hider_small.png')
         self.rect = self.image.get_rect(topleft=[x, y])
+        self.spawn = (x, y)
         self.interaction_times = 0
-        self.fov = ['_', '_', '_', '_', '_', '_', '_', '_', '_', '_']
+        self.obs = np.zeros(STATE_SIZE, dtype=np.int8)
+        self.fov = self.obs[OBS_FOV]
         self.direction = RIGHT
         self.grabbed_obj = False
         self.obj_rect = None
@@ -635,6 +760,20 @@ class Hider(pygame.sprite.Sprite):
             RIGHT_ST: direction_move_map[situated_right_move_map[self.direction]],
         }
 
+    def use_obs(self, obs):
+        # Keep the observation in obs (a row of the Game's buffer) from now on
+        obs[:] = self.obs
+        self.obs = obs
+        self.fov = obs[OBS_FOV]
+
+    def reset(self):
+        self.rect.topleft = self.spawn
+        self.interaction_times = 0
+        self.fov[:] = EMPTY_FOV
+        self.direction = RIGHT
+        self.grabbed_obj = False
+        self.obj_rect = None
+
     def move(self, direction, moved_back=False, situated=False):
         # Get move coordinates and set players direction
         # This is based on whether the movement is situated or not
@@ -674,10 +813,12 @@ class Seeker(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
 
-        self.image = pygame.image.load('png/seeker_small.png')
+        self.image = load_image('png/seeker_small.png')
         self.rect = self.image.get_rect(topleft=[x, y])
+        self.spawn = (x, y)
         self.direction = RIGHT
-        self.fov = ['_', '_', '_', '_', '_', '_', '_', '_', '_', '_']
+        self.obs = np.zeros(STATE_SIZE, dtype=np.int8)
+        self.fov = self.obs[OBS_FOV]
         self.interaction_times = 0
         self.grabbed_obj = False
         self.obj_rect = None
@@ -689,6 +830,20 @@ class Seeker(pygame.sprite.Sprite):
             RIGHT_ST: direction_move_map[situated_right_move_map[self.direction]],
         }
 
+    def use_obs(self, obs):
+        # Keep the observation in obs (a row of the Game's buffer) from now on
+        obs[:] = self.obs
+        self.obs = obs
+        self.fov = obs[OBS_FOV]
+
+    def reset(self):
+        self.rect.topleft = self.spawn
+        self.direction = RIGHT
+        self.fov[:] = EMPTY_FOV
+        self.interaction_times = 0
+        self.grabbed_obj = False
+        self.obj_rect = None
+
     def move(self, direction, moved_back=False, situated=False):
         # Get move coordinates and set players direction
         x, y = direction_move_map[direction] if not situated else self.situated_move_map[direction]
@@ -745,24 +900,30 @@ class Crate(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
 
-        self.image = pygame.image.load('png/pngwing.com.png')
+        self.image = load_image('png/pngwing.com.png')
         self.rect = self.image.get_rect(topleft=[x, y])
+        self.spawn = (x, y)
+
+    def reset(self):
+        self.rect.topleft = self.spawn
 
 
 class Hammer(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
 
-        self.image = pygame.image.load('png/hammer.png')
+        self.image = load_image('png/hammer.png')
         self.rect = self.image.get_rect(topleft=[x, y])
+        self.spawn = (x, y)
+
+    def reset(self):
+        self.rect.topleft = self.spawn
 
 
 if __name__ == '__main__':
     # Initialize the game, together with the hiders and seekers
 
-    game = Game(
-        screen
-    )
+    game = Game()
 
     if DEBUG:
         while True:
@@ -790,6 +951,12 @@ if __name__ == '__main__':
         file_name = 'heuristics'  # '_situated' if situated_moves else '_regular'
         motivation_suffix = 'fov100'  # '_intrinsic' if intrinsic_motivation else ''  # emergent
         round_winners = {'hiders': 0, 'seekers': 0}
+        metrics = MetricsWriter({
+            'hider_rewards': 'hider_rewards{}{}.csv'.format(file_name, motivation_suffix),
+            'seeker_rewards': 'seeker_rewards{}{}.csv'.format(file_name, motivation_suffix),
+            'hiders_interaction': 'hiders_interaction{}{}.csv'.format(file_name, motivation_suffix),
+            'seekers_interaction': 'seekers_interaction{}{}.csv'.format(file_name, motivation_suffix),
+        }, 'round_winners{}{}.csv'.format(file_name, motivation_suffix))
         hiders_total_interaction_times = []
         seekers_total_interaction_times = []
 
@@ -873,24 +1040,20 @@ if __name__ == '__main__':
                 plot_mean_hider_rewards.append(total_reward_hider_team / n_games)
                 plot_mean_seeker_rewards.append(total_reward_seeker_team / n_games)
 
+                # Append this episode to the CSV files
+                metrics.append({'hider_rewards': reward_hider_team, 'seeker_rewards': reward_seeker_team,
+                                'hiders_interaction': hiders_total_interaction_times[-1],
+                                'seekers_interaction': seekers_total_interaction_times[-1]}, round_winners)
+
                 reward_hider_team, reward_seeker_team = 0, 0
                 # total_score += r_hiders
                 # mean_score = total_score / agent_ha.n_games
                 # plot_hider_mean_rewards.append(mean_score)
-                save_to_csv(plot_hider_rewards, 'hider_rewards{}{}.csv'.format(file_name,
-                                                                               motivation_suffix))
-                save_to_csv(plot_seeker_rewards, 'seeker_rewards{}{}.csv'.format(file_name,
-                                                                                 motivation_suffix))
-                save_to_csv(hiders_total_interaction_times, 'hiders_interaction{}{}.csv'.format(file_name,
-                                                                                                motivation_suffix))
-                save_to_csv(seekers_total_interaction_times, 'seekers_interaction{}{}.csv'.format(file_name,
-                                                                                                  motivation_suffix))
-                save_dict_to_csv(round_winners, 'round_winners{}{}.csv'.format(file_name,
-                                                                               motivation_suffix))
 
                 plot_rewards(plot_hider_rewards, plot_seeker_rewards, plot_mean_hider_rewards, plot_mean_seeker_rewards)
 
                 if n_games >= 2000:
+                    metrics.close()
                     break
                 # plot_interaction(hiders_interaction_times, seekers_interaction_times)
 
@@ -910,6 +1073,11 @@ if __name__ == '__main__':
         reward_seeker_team = 0
         total_reward_seeker_team = 0
 
+        metrics = MetricsWriter({'hider_rewards': 'random_hider_rewards.csv',
+                                 'seeker_rewards': 'random_seeker_rewards.csv',
+                                 'hiders_interaction': 'random_hiders_interaction.csv',
+                                 'seekers_interaction': 'random_seekers_interaction.csv'})
+
         # game loop
         n_games = 0
         while True:
@@ -953,12 +1121,11 @@ if __name__ == '__main__':
                 plot_mean_hider_rewards.append(total_reward_hider_team/n_games)
                 plot_mean_seeker_rewards.append(total_reward_seeker_team/n_games)
 
-                reward_hider_team, reward_seeker_team = 0, 0
+                metrics.append({'hider_rewards': reward_hider_team, 'seeker_rewards': reward_seeker_team,
+                                'hiders_interaction': hiders_total_interaction_times[-1],
+                                'seekers_interaction': seekers_total_interaction_times[-1]})
 
-                save_to_csv(plot_hider_rewards, 'random_hider_rewards.csv')
-                save_to_csv(plot_seeker_rewards, 'random_seeker_rewards.csv')
-                save_to_csv(hiders_total_interaction_times, 'random_hiders_interaction.csv')
-                save_to_csv(seekers_total_interaction_times, 'random_seekers_interaction.csv')
+                reward_hider_team, reward_seeker_team = 0, 0
 
                 plot_rewards(plot_hider_rewards, plot_seeker_rewards, plot_mean_hider_rewards, plot_mean_seeker_rewards)
 
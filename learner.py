@@ -0,0 +1,86 @@
+import copy
+import threading
+import profiling
+from checkpoint import copy_state_dict
+
+# Training the agents on a thread of its own, so the game never waits for a backward pass. The game (the
+# actor) only pushes transitions into the replay memories and calls step() once per tick; the learner thread
+# samples batches from the memories and updates the agents' models, replay_ratio updates per tick. Torch
+# releases the GIL inside its operators, so most of an update runs next to the game.
+#
+# The actor doesn't act with the models being trained but with copies of them (actor_models), which get the
+# new weights every publish_every updates. Anything else that reads or writes the trained models, optimizers
+# or memories as a whole (checkpoints, snapshots) holds the lock, which the learner holds during an update
+
+
+class Learner:
+
+    def __init__(self, agents, replay_ratio=0.25, publish_every=50, batch_size=64):
+        self.agents = agents
+        self.replay_ratio = replay_ratio  # Updates of every agent per tick of the game
+        self.publish_every = publish_every
+        self.batch_size = batch_size
+
+        self.actor_models = [copy.deepcopy(agent.model) for agent in agents]
+        self.published = None  # Weights waiting to be picked up by the actor
+        self.version = 0  # of the published weights
+        self.actor_version = 0  # of the actor_models
+
+        self.ticks = 0
+        self.updates = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def step(self):
+        # Called by the actor after pushing the transitions of a tick. Never waits for the learner
+        self.check()
+        self.ticks += 1
+        self.wake.set()
+
+        if self.version != self.actor_version:
+            version, states = self.version, self.published
+            for model, state in zip(self.actor_models, states):
+                model.load_state_dict(state)
+            self.actor_version = version
+
+    def behind(self):
+        return self.updates < self.replay_ratio * self.ticks
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                if not self.behind():
+                    self.wake.clear()
+                    if not self.behind():
+                        self.wake.wait(0.1)
+                    continue
+
+                with self.lock, profiling.phase('learner.update'):
+                    for agent in self.agents:
+                        agent.train_long_memory(self.batch_size)
+                    self.updates += 1
+
+                    if self.updates % self.publish_every == 0:
+                        self.publish()
+        except Exception as error:
+            self.error = error
+
+    def publish(self):
+        # The states are assigned before the version, the actor never picks up a version without its weights
+        self.published = [copy_state_dict(agent.model) for agent in self.agents]
+        self.version += 1
+
+    def check(self):
+        # A failed update shows up in the training loop instead of silently stopping the learning
+        if self.error is not None:
+            raise RuntimeError('The learner thread failed') from self.error
+
+    def close(self):
+        self.stopping.set()
+        self.wake.set()
+        self.thread.join()
+        self.check()
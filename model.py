@@ -9,6 +9,7 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
+import numpy as np
 import os
 
 
@@ -46,13 +47,16 @@ class QTrainer:
         self.optimizer = optim.Adam(model.parameters(), lr=self.lr) # We chose the adam optimizer
         self.criterion = nn.MSELoss() # loss function (Mean Squared Error)
 
-    def train_step(self, state, action, reward, next_state, game_over):
+    def train_step(self, state, action, reward, next_state, game_over, weights=None):
+        # weights: optional importance sampling weight per sample (prioritized replay)
+        # Returns the TD error of every sample
         # Convert to pytorch tensor
         # If we passed multple values per parameter, they we already have the correct shape (Batch Size, X)
-        state = torch.tensor(state, dtype=torch.float)
-        next_state = torch.tensor(next_state, dtype=torch.float)
-        action = torch.tensor(action, dtype=torch.long)
-        reward = torch.tensor(reward, dtype=torch.float)
+        state = to_tensor(state, torch.float)
+        next_state = to_tensor(next_state, torch.float)
+        action = to_tensor(action, torch.long)
+        reward = to_tensor(reward, torch.float)
+        game_over = to_tensor(game_over, torch.bool)
 
         # If we passed only one, then we want to torch.un squeeze to reach (1, x)
         if len(state.shape) == 1:
@@ -61,27 +65,52 @@ class QTrainer:
             next_state = torch.unsqueeze(next_state, 0)
             action = torch.unsqueeze(action, 0)
             reward = torch.unsqueeze(reward, 0)
-            game_over = (game_over,)
+            game_over = torch.unsqueeze(game_over, 0)
 
-        # Get predicted Q values with current (old) state
-        pred = self.model(state) # This is the action so example [0, 0, 0, 0, 1]
+        # Get predicted Q values with current (old) state, and of the next states, in a single forward pass
+        all_pred = self.model(torch.cat((state, next_state)))
+        pred, next_pred = all_pred[:len(state)], all_pred[len(state):] # This is the action so example [0, 0, 0, 0, 1]
 
         # 2: Q_new = r + y * max(next_predicted Q value) -> only do this if not game_over
-        # pred.clone()
-        # preds[argmax(action)] = Q_new, The index of the 1 is set to the new Q value
+        Q_new = torch.where(game_over, reward, reward + self.gamma * torch.max(next_pred, dim=1).values)
 
-        target = pred.clone()
-        for idx in range(len(game_over)):
-            Q_new = reward[idx]  # Reward of the current index
-            if not game_over[idx]:
-                # If not done, then get the reward at the current index + gamma * the maximum value
-                # of the next prediction
-                Q_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
-            # Set the target of the maximum value of the action to this Q_new value
-            target[idx][torch.argmax(action[idx]).item()] = Q_new
+        # preds[argmax(action)] = Q_new, The index of the 1 is set to the new Q value
+        action_idx = torch.argmax(action, dim=1, keepdim=True)
+        target = pred.scatter(1, action_idx, Q_new.unsqueeze(1))
 
         self.optimizer.zero_grad()  # To empty the gradients
-        loss = self.criterion(target, pred)  # Calculate the loss with the target and prediction (Qnew, Q)
+        if weights is None:
+            loss = self.criterion(target, pred)  # Calculate the loss with the target and prediction (Qnew, Q)
+        else:
+            # Same mean squared error, with every sample scaled by its importance sampling weight
+            weights = to_tensor(weights, torch.float)
+            loss = torch.mean(weights.unsqueeze(1) * (target - pred) ** 2)
         loss.backward()  # Apply back propagation and update gradients
 
         self.optimizer.step()
+
+        return (Q_new - pred.gather(1, action_idx).squeeze(1)).detach()
+
+
+def to_tensor(values, dtype):
+    # Tensors are used as they are, anything else (arrays, lists or tuples of arrays) goes through one NumPy array
+    if isinstance(values, torch.Tensor):
+        return values.to(dtype)
+
+    return torch.as_tensor(np.asarray(values), dtype=dtype)
+
+
+def stacked_forward(models, x):
+    # Forward of several Linear_QNets at once: x is (..., len(models), input_size) and the networks are
+    # applied along the last but one axis. The layers are stacked so all of them run as one batched matmul
+    w1 = torch.stack([model.linear1.weight for model in models])
+    b1 = torch.stack([model.linear1.bias for model in models])
+    w2 = torch.stack([model.linear2.weight for model in models])
+    b2 = torch.stack([model.linear2.bias for model in models])
+
+    # (models, batch, input_size)
+    xt = x.reshape(-1, x.shape[-2], x.shape[-1]).transpose(0, 1)
+    hidden = F.relu(torch.baddbmm(b1.unsqueeze(1), xt, w1.transpose(1, 2)))
+    out = torch.baddbmm(b2.unsqueeze(1), hidden, w2.transpose(1, 2))
+
+    return out.transpose(0, 1).reshape(*x.shape[:-1], -1)
@@ -6,6 +6,12 @@ https://github.com/patrickloeber/snake-ai-pytorch
 '''
 
 import os
+import time
+import atexit
+import numbers
+import queue
+import multiprocessing as mp
+import numpy as np
 import matplotlib.pyplot as plt
 from IPython import display
 import pandas as pd
@@ -76,5 +82,179 @@ def save_dict_to_csv(round_winners, file_name):
         os.makedirs(model_folder_path)
     file_name = os.path.join(model_folder_path, file_name)
 
-    df = pd.DataFrame.from_dict(round_winners, orient="index")
-    df.to_csv(file_name)
\ No newline at end of file
+    # Same file as pd.DataFrame.from_dict(round_winners, orient="index").to_csv(file_name). It is tiny, so it
+    # is written whole to a temporary file that replaces the old one, a crash never leaves half a file
+    lines = [',0'] + ['{},{}'.format(key, format_value(value)) for key, value in round_winners.items()]
+    with open(file_name + '.tmp', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(file_name + '.tmp', file_name)
+
+
+def format_value(value):
+    # How pandas writes a number to a CSV
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+
+    return repr(float(value))
+
+
+class MetricsWriter:
+    # Append only replacement for calling save_to_csv with the whole history after every episode. Every metric
+    # goes to its own file under pandas_plots with one value per line (what save_to_csv writes). Rows are
+    # buffered and appended when flush_every of them are waiting or flush_seconds passed since the last
+    # flush, so a crash loses at most one buffer. The totals (round winners) are rewritten with the rows
+
+    def __init__(self, file_names, totals_file_name=None, flush_every=50, flush_seconds=30.0, keep_rows=0):
+        # file_names: metric -> CSV file name. The files start out with their first keep_rows rows, none for a
+        # new run (like it used to overwrite them), the episodes played so far when a run is resumed
+        self.folder = './pandas_plots'
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        self.paths = {metric: os.path.join(self.folder, file_name) for metric, file_name in file_names.items()}
+        self.totals_file_name = totals_file_name
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+
+        self.rows = []
+        self.totals = None
+        self.last_flush = time.monotonic()
+
+        for path in self.paths.values():
+            lines = []
+            if keep_rows and os.path.exists(path):
+                with open(path) as f:
+                    lines = f.readlines()[:keep_rows]
+            with open(path, 'w') as f:
+                f.writelines(lines)
+
+        # Whatever is still buffered when the interpreter exits (also after an exception) gets written
+        atexit.register(self.flush)
+
+    def append(self, row, totals=None):
+        # row: metric -> value of one episode
+        self.rows.append(row)
+        if totals is not None:
+            self.totals = dict(totals)
+
+        if len(self.rows) >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            for metric, path in self.paths.items():
+                with open(path, 'a') as f:
+                    f.write(''.join(format_value(row[metric]) + '\n' for row in self.rows))
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.rows = []
+
+        if self.totals is not None and self.totals_file_name is not None:
+            save_dict_to_csv(self.totals, self.totals_file_name)
+            self.totals = None
+
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+
+
+def decimate(values, max_points):
+    # x positions and values of at most about max_points points that still show the shape of the series: the
+    # series is cut into equal buckets and only the lowest and highest point of every bucket are kept, so
+    # spikes don't disappear like they would with every n-th point
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n), values
+
+    bucket = -(-n // (max_points // 2))
+    full = n - n % bucket
+    buckets = values[:full].reshape(-1, bucket)
+    starts = np.arange(0, full, bucket)
+
+    low = starts + buckets.argmin(axis=1)
+    high = starts + buckets.argmax(axis=1)
+    x = np.concatenate([np.sort(np.stack([low, high], axis=1), axis=1).reshape(-1), np.arange(full, n)])
+
+    return x, values[x]
+
+
+def render_rewards(path, hider_scores, seeker_scores, mean_hider_scores, mean_seeker_scores, max_points):
+    # Same plot as plot_rewards, written to path (through a temporary file, so a viewer never sees half a PNG)
+    plt.clf()
+    plt.title('Training Both Teams')
+    plt.xlabel('Number of Games')
+    plt.ylabel('Score')
+    for scores, label in ((hider_scores, 'Hiders reward'), (seeker_scores, 'Seekers reward'),
+                          (mean_hider_scores, 'Hider mean score'), (mean_seeker_scores, 'Seeker mean score')):
+        plt.plot(*decimate(scores, max_points), label=label)
+    plt.legend(loc='upper right')
+    plt.text(len(hider_scores)-1, hider_scores[-1], str(hider_scores[-1]))
+    plt.text(len(seeker_scores)-1, seeker_scores[-1], str(seeker_scores[-1]))
+
+    root, ext = os.path.splitext(path)
+    plt.savefig(root + '.tmp' + ext)
+    os.replace(root + '.tmp' + ext, path)
+
+
+def plot_worker(scores, path, every_seconds, max_points):
+    # Runs in the plotting process. Collects the episodes coming in and redraws at most every every_seconds,
+    # and once more when the stream ends (None)
+    plt.switch_backend('Agg')
+    series = ([], [], [], [])
+    changed = False
+    next_render = time.monotonic()
+
+    while True:
+        try:
+            episode = scores.get(timeout=max(0.0, next_render - time.monotonic()) if changed else None)
+        except queue.Empty:
+            episode = ()
+
+        if episode is None:
+            break
+        for values, value in zip(series, episode):
+            values.append(value)
+        changed = changed or bool(episode)
+
+        if changed and time.monotonic() >= next_render:
+            render_rewards(path, *series, max_points)
+            changed = False
+            next_render = time.monotonic() + every_seconds
+
+    if changed:
+        render_rewards(path, *series, max_points)
+
+
+class BackgroundPlotter:
+    # Non blocking replacement for calling plot_rewards after every episode. The scores of every episode are
+    # sent to a separate process, which keeps the whole history and redraws the plot to a PNG under
+    # pandas_plots every every_seconds. Long series are decimated to about max_points points per line, so a
+    # redraw costs the same after 200 or 20000 episodes. The training loop only puts a tuple on a queue
+
+    def __init__(self, file_name='training_rewards.png', every_seconds=5.0, max_points=2000):
+        folder = './pandas_plots'
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = os.path.join(folder, file_name)
+
+        ctx = mp.get_context('spawn')
+        self.scores = ctx.Queue()
+        self.process = ctx.Process(target=plot_worker, args=(self.scores, self.path, every_seconds, max_points),
+                                   daemon=True)
+        self.process.start()
+
+    def append(self, hider_score, seeker_score, mean_hider_score, mean_seeker_score):
+        # The queue is unbounded and put hands the item to a feeder thread, so this never waits for the plot
+        self.scores.put((hider_score, seeker_score, mean_hider_score, mean_seeker_score))
+
+    def close(self, timeout=30):
+        # Lets the plotting process draw the last episodes and waits for it to finish
+        self.scores.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        # Whatever the process didn't read is dropped, instead of blocking the exit of the training process
+        self.scores.cancel_join_thread()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import queue
+import threading
+import profiling
+
+# Sampling replay batches ahead of time. A worker thread samples from the memory and turns the samples into
+# tensors (unpacking them for a bit packed memory) while the networks train on the previous batch, and keeps
+# up to depth of them ready in a queue. get() then only has to take the next one.
+#
+# A batch is only sampled once a slot in the queue is free, and not before the memory holds batch_size
+# transitions. It still misses what is pushed while it waits and, with prioritized replay, the priorities
+# updated meanwhile, so this is meant for updates that run back to back (the Learner thread), not for one
+# batch at the end of every episode
+
+
+class BatchPrefetcher:
+
+    def __init__(self, memory, batch_size, depth=2):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.batches = queue.Queue()
+        self.slots = threading.Semaphore(depth)  # Free places in the queue
+        self.stopping = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                if len(self.memory) < self.batch_size:
+                    self.stopping.wait(0.01)
+                    continue
+                # Keeps checking for close() while the queue is full
+                if not self.slots.acquire(timeout=0.1):
+                    continue
+
+                with profiling.phase('prefetch.sample'):
+                    self.batches.put(self.memory.sample(self.batch_size))
+        except Exception as error:
+            self.error = error
+
+    def get(self):
+        # The next batch, as memory.sample(batch_size) returns it. Waits if none is ready yet
+        while True:
+            self.check()
+            try:
+                batch = self.batches.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.slots.release()
+
+            return batch
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError('Sampling a replay batch failed') from self.error
+
+    def close(self):
+        self.stopping.set()
+        self.thread.join()
+        self.check()
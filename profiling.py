@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+
+# Per phase timing of the game and the training loop. Off unless HIDE_SEEK_PROFILE is set, and then
+#
+#   with profiling.phase('tick.fov'):
+#       ...
+#
+#   @profiling.profiled('get_action')
+#   def get_action(...):
+#
+# record how long every call took in a histogram per phase. A summary (calls, calls/s, mean, p50, p99) is
+# printed every HIDE_SEEK_PROFILE_EVERY seconds (30 by default) and at exit, and with HIDE_SEEK_PROFILE_TRACE
+# set to a file name every call is also written there as Chrome trace JSON (chrome://tracing or Perfetto).
+#
+# When it is off, phase() hands out one shared do nothing context manager and profiled() returns the
+# function itself, so the hooks can stay in the code
+
+ENABLED = os.environ.get('HIDE_SEEK_PROFILE', '') not in ('', '0')
+TRACE_FILE = os.environ.get('HIDE_SEEK_PROFILE_TRACE') or None
+REPORT_EVERY = float(os.environ.get('HIDE_SEEK_PROFILE_EVERY', 30))
+MAX_TRACE_EVENTS = 1_000_000  # About 100 MB of JSON, later calls only go to the histograms
+
+# Histogram buckets: 8 per power of two, so a percentile is off by at most 1/16 of its value
+SUB_BUCKETS = 8
+SUB_BITS = 3
+
+NULL_PHASE = contextlib.nullcontext()
+
+
+def bucket_index(ns):
+    if ns < SUB_BUCKETS:
+        return ns
+    exponent = ns.bit_length() - 1
+    return (exponent - SUB_BITS + 1) * SUB_BUCKETS + ((ns >> (exponent - SUB_BITS)) & (SUB_BUCKETS - 1))
+
+
+def bucket_middle(index):
+    # Middle of the range of durations (in ns) that land in the bucket
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((SUB_BUCKETS + index % SUB_BUCKETS) << shift) + (1 << shift) / 2
+
+
+class Phase:
+    # Context manager that times its block. There is one per name, reused by every call, also from several
+    # threads (the learner, the prefetchers) and nested in itself: the start times are kept on a stack per
+    # thread and the counts are updated under a lock
+
+    def __init__(self, name, profiler):
+        self.name = name
+        self.profiler = profiler
+        self.histogram = {}  # bucket index -> calls
+        self.calls = 0
+        self.total_ns = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        starts = getattr(self.local, 'starts', None)
+        if starts is None:
+            starts = self.local.starts = []
+        starts.append(time.perf_counter_ns())
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.record(self.local.starts.pop(), end)
+
+    def record(self, start, end):
+        duration = end - start
+        index = bucket_index(duration)
+        with self.lock:
+            self.histogram[index] = self.histogram.get(index, 0) + 1
+            self.calls += 1
+            self.total_ns += duration
+
+        profiler = self.profiler
+        if profiler.trace is not None and len(profiler.trace) < MAX_TRACE_EVENTS:
+            profiler.trace.append((self.name, start, duration, threading.get_ident()))
+        if end >= profiler.next_report:
+            profiler.report()
+
+    def percentile(self, q):
+        # Duration in ns below which q percent of the calls took
+        with self.lock:
+            histogram = dict(self.histogram)
+        rank = q / 100 * sum(histogram.values())
+        seen = 0
+        for index in sorted(histogram):
+            seen += histogram[index]
+            if seen >= rank:
+                return bucket_middle(index)
+
+        return 0
+
+
+class Profiler:
+    def __init__(self, report_every=REPORT_EVERY, trace_file=TRACE_FILE):
+        self.phases = {}
+        self.started = time.perf_counter_ns()
+        self.report_every = int(report_every * 1e9)
+        self.next_report = self.started + self.report_every
+        self.trace_file = trace_file
+        self.trace = [] if trace_file else None
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        timer = self.phases.get(name)
+        if timer is None:
+            with self.lock:
+                timer = self.phases.setdefault(name, Phase(name, self))
+
+        return timer
+
+    def summary(self):
+        # One dict per phase, times in microseconds
+        seconds = max(time.perf_counter_ns() - self.started, 1) / 1e9
+        return [{'phase': name, 'calls': timer.calls, 'calls_per_s': timer.calls / seconds,
+                 'total_ms': timer.total_ns / 1e6, 'mean_us': timer.total_ns / timer.calls / 1e3,
+                 'p50_us': timer.percentile(50) / 1e3, 'p99_us': timer.percentile(99) / 1e3}
+                for name, timer in sorted(list(self.phases.items())) if timer.calls]
+
+    def report(self, file=sys.stderr):
+        self.next_report = time.perf_counter_ns() + self.report_every
+        rows = self.summary()
+        if not rows:
+            return
+
+        print('{:<28} {:>10} {:>10} {:>11} {:>10} {:>10} {:>10}'.format(
+            'phase', 'calls', 'calls/s', 'total ms', 'mean us', 'p50 us', 'p99 us'), file=file)
+        for row in rows:
+            print('{phase:<28} {calls:>10} {calls_per_s:>10.1f} {total_ms:>11.1f} {mean_us:>10.1f} '
+                  '{p50_us:>10.1f} {p99_us:>10.1f}'.format(**row), file=file)
+
+    def write_trace(self):
+        # Complete events ('X') with the times in microseconds since the profiler started
+        if not self.trace:
+            return
+
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'ts': (start - self.started) / 1e3, 'dur': duration / 1e3,
+                   'pid': pid, 'tid': tid} for name, start, duration, tid in self.trace]
+        with open(self.trace_file + '.tmp', 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(self.trace_file + '.tmp', self.trace_file)
+
+    def close(self):
+        self.report()
+        self.write_trace()
+
+
+profiler = Profiler() if ENABLED else None
+if profiler is not None:
+    atexit.register(profiler.close)
+
+
+def phase(name):
+    # with phase('name'): times the block
+    if profiler is None:
+        return NULL_PHASE
+
+    return profiler.phase(name)
+
+
+def profiled(name=None):
+    # Decorator timing every call of the function, under its qualified name unless a name is given
+    def decorate(func):
+        if profiler is None:
+            return func
+
+        timer = profiler.phase(name or func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.record(start, time.perf_counter_ns())
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,150 @@
+import numpy as np
+
+# Vectorized ray casting over axis aligned rectangles.
+#
+# A "ray" in the game is the bounding Rect that pygame.draw.line(surface, color, start, end, 2) returns,
+# so line_rects reproduces that Rect exactly (same clipping, same Bresenham rounding) without a surface.
+# All functions work on NumPy arrays with any number of leading (batch) dimensions.
+#
+# Rects are int64 arrays whose last axis is (x, y, w, h)
+
+NO_HIT = 0
+
+
+def _round_away(values):
+    # (int)(v < 0 ? v - 0.5 : v + 0.5) like the C code
+    return np.where(values < 0, np.trunc(values - 0.5), np.trunc(values + 0.5)).astype(np.int64)
+
+
+def _clip_line(x1, y1, x2, y2, clip_w, clip_h):
+    # Liang-Barsky clipping exactly like clip_line in pygame's draw.c
+    p1 = x1 - x2
+    p2 = -p1
+    p3 = y1 - y2
+    p4 = -p3
+    q1 = x1
+    q2 = clip_w - x1
+    q3 = y1
+    q4 = clip_h - y1
+
+    visible = ~(((p1 == 0) & (q1 < 0)) | ((p2 == 0) & (q2 < 0)) |
+                ((p3 == 0) & (q3 < 0)) | ((p4 == 0) & (q4 < 0)))
+
+    nmax = np.zeros(x1.shape)
+    pmin = np.ones(x1.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q_a, q_b in ((p1, q1, q2), (p3, q3, q4)):
+            r1 = q_a / p
+            r2 = q_b / -p
+            nmax = np.where((p < 0) & (r1 > nmax), r1, nmax)
+            pmin = np.where((p < 0) & (r2 < pmin), r2, pmin)
+            nmax = np.where((p > 0) & (r2 > nmax), r2, nmax)
+            pmin = np.where((p > 0) & (r1 < pmin), r1, pmin)
+
+    visible &= ~(nmax > pmin)
+
+    return (visible,
+            x1 + _round_away(p2 * nmax), y1 + _round_away(p4 * nmax),
+            x1 + _round_away(p2 * pmin), y1 + _round_away(p4 * pmin))
+
+
+def _first_step_reaching(m, du, dv, err):
+    # Bresenham steps minor axis n_k = ceil((k * dv - err) / du) times after k steps on the major axis.
+    # Returns the smallest k for which n_k >= m (a huge number if it never happens)
+    never = np.iinfo(np.int64).max // 4
+    k = np.where(dv > 0, ((m - 1) * du + err) // np.maximum(dv, 1) + 1, never)
+    return np.where(m <= 0, 0, k)
+
+
+def line_rects(x1, y1, x2, y2, clip_w, clip_h):
+    # Bounding Rect of pygame.draw.line(surface, color, (x1, y1), (x2, y2), width=2) on a clip_w x clip_h surface
+    x1, y1, x2, y2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in (x1, y1, x2, y2)))
+
+    # pygame grows the thickness along x for steep lines and along y otherwise. Swap the axes of the steep
+    # lines so that u is always the major axis and v the minor one, the algorithm is symmetric
+    steep = np.abs(x1 - x2) <= np.abs(y1 - y2)
+    u1, v1 = np.where(steep, y1, x1), np.where(steep, x1, y1)
+    u2, v2 = np.where(steep, y2, x2), np.where(steep, x2, y2)
+    clip_u, clip_v = np.where(steep, clip_h, clip_w), np.where(steep, clip_w, clip_h)
+
+    du = np.abs(u2 - u1)
+    dv = np.abs(v2 - v1)
+    su = np.where(u1 < u2, 1, -1)
+    sv = np.where(v1 < v2, 1, -1)
+    err = du // 2
+    du_safe = np.maximum(du, 1)
+
+    visible, cu1, cv1, cu2, cv2 = _clip_line(u1, v1, u2, v2, clip_u, clip_v)
+
+    # Point k of the walk from the clipped start is (cu1 + su * k, cv1 + sv * n_k).
+    # The first loop runs until both axes have reached the clipped end point
+    k_major = np.maximum(su * (cu2 - cu1), 0)
+    k_minor = _first_step_reaching(sv * (cv2 - cv1), du_safe, dv, err)
+    k_loop = np.maximum(k_major, k_minor)
+
+    # Steps whose 2 pixel wide span (v and v + 1) touches the clip area
+    u_low = np.where(su > 0, -cu1, cu1 - (clip_u - 1))
+    u_high = np.where(su > 0, clip_u - 1 - cu1, cu1)
+    n_low = np.where(sv > 0, -1 - cv1, cv1 - clip_v + 1)
+    n_high = np.where(sv > 0, clip_v - 1 - cv1, cv1 + 1)
+    inside_low = np.maximum(np.maximum(u_low, _first_step_reaching(n_low, du_safe, dv, err)), 0)
+    inside_high = np.minimum(u_high, _first_step_reaching(n_high + 1, du_safe, dv, err) - 1)
+
+    # After the first loop pygame keeps walking while inside the clip area, until the original end point
+    k_end = su * (u2 - cu1)
+    k_end = np.where(k_end >= k_loop, k_end, np.iinfo(np.int64).max // 4)
+    loop_inside = (inside_low <= k_loop) & (k_loop <= inside_high)
+    last = np.where(loop_inside, np.minimum(inside_high, k_end), np.minimum(inside_high, k_loop - 1))
+    first = inside_low
+
+    drawn = visible & (first <= last)
+
+    u_first, u_last = cu1 + su * first, cu1 + su * last
+    v_first = cv1 + sv * -((err - first * dv) // du_safe)
+    v_last = cv1 + sv * -((err - last * dv) // du_safe)
+
+    u_min = np.minimum(u_first, u_last)
+    u_max = np.maximum(u_first, u_last)
+    v_min = np.maximum(np.minimum(v_first, v_last), 0)
+    v_max = np.minimum(np.maximum(v_first, v_last) + 1, clip_v - 1)
+
+    x = np.where(steep, v_min, u_min)
+    y = np.where(steep, u_min, v_min)
+    w = np.where(steep, v_max - v_min + 1, u_max - u_min + 1)
+    h = np.where(steep, u_max - u_min + 1, v_max - v_min + 1)
+
+    # Nothing drawn: pygame returns a zero sized Rect at the start position
+    return np.stack([np.where(drawn, x, x1), np.where(drawn, y, y1),
+                     np.where(drawn, w, 0), np.where(drawn, h, 0)], axis=-1)
+
+
+def cast_rays(rays, keys, forward, obj_rects, obj_codes, obj_valid=None):
+    # For every ray return the code of the hit object with the nearest key.
+    #
+    # rays:      (..., R, 4) ray rects
+    # keys:      (..., M) the coordinate objects are ordered by along the ray
+    # forward:   (...,) True if the smallest key is the nearest, False if the largest is
+    # obj_rects: (..., M, 4), obj_codes: (M,) or (..., M), obj_valid: (..., M) bool or None
+    #
+    # On equal keys the object that comes last wins, zero sized rects never hit (like Rect.colliderect)
+    rays = np.asarray(rays)
+    obj_rects = np.asarray(obj_rects)
+
+    rx, ry, rw, rh = (rays[..., :, None, i] for i in range(4))
+    ox, oy, ow, oh = (obj_rects[..., None, :, i] for i in range(4))
+    hit = (rx < ox + ow) & (ry < oy + oh) & (rx + rw > ox) & (ry + rh > oy) & \
+          (rw > 0) & (rh > 0) & (ow > 0) & (oh > 0)
+    if obj_valid is not None:
+        hit &= np.asarray(obj_valid)[..., None, :]
+
+    n_objects = obj_rects.shape[-2]
+    keys = np.asarray(keys, dtype=np.int64)
+    signed_keys = np.where(np.asarray(forward)[..., None], keys, -keys)
+    score = signed_keys * n_objects + (n_objects - 1 - np.arange(n_objects))
+    score = np.where(hit, score[..., None, :], np.iinfo(np.int64).max)
+    nearest = np.argmin(score, axis=-1)
+
+    codes = np.broadcast_to(np.asarray(obj_codes)[..., None, :], hit.shape)
+    codes = np.take_along_axis(codes, nearest[..., None], axis=-1)[..., 0]
+
+    return np.where(hit.any(axis=-1), codes, NO_HIT)
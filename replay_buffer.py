@@ -0,0 +1,373 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+import numpy as np
+import torch
+from transition_codec import pack_transitions, unpack_transitions
+
+
+class ReplayBuffer:
+    # Replay memory in preallocated contiguous arrays. New transitions overwrite the oldest ones once the
+    # buffer is full (like a deque with maxlen), and a sampled batch comes back as ready to use tensors.
+    # Pushing, sampling and (de)serializing hold the lock, so a learner thread can sample while the game pushes
+
+    arrays = ('states', 'actions', 'rewards', 'next_states', 'dones')
+
+    def __init__(self, capacity, state_size, action_size):
+        self.capacity = capacity
+        self.state_size = state_size
+        self.action_size = action_size
+        self.index = 0  # Where the next transition is written
+        self.size = 0
+        self.pushes = 0  # Transitions pushed so far, also those overwritten since
+        self.rng = np.random.default_rng()
+        self.lock = threading.RLock()
+        self.allocate_arrays()
+
+    def allocate_arrays(self):
+        capacity = self.capacity
+        self.states = self.allocate('states', (capacity, self.state_size), np.float32)
+        self.actions = self.allocate('actions', (capacity, self.action_size), np.int64)
+        self.rewards = self.allocate('rewards', (capacity,), np.float32)
+        self.next_states = self.allocate('next_states', (capacity, self.state_size), np.float32)
+        self.dones = self.allocate('dones', (capacity,), np.bool_)
+
+    def allocate(self, name, shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+
+    def write(self, idx, states, actions, rewards, next_states, dones):
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+
+    def __len__(self):
+        return self.size
+
+    def push(self, state, action, reward, next_state, done):
+        with self.lock:
+            idx = self.index
+            self.write(idx, state, action, reward, next_state, done)
+
+            self.index = (idx + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            self.pushes += 1
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        # Write many transitions at once, wrapping around the end of the buffer. Returns the indices written
+        if not len(rewards):
+            return np.zeros(0, dtype=np.int64)
+        with self.lock:
+            idx = (self.index + np.arange(len(rewards))) % self.capacity
+            self.write(idx, states, actions, rewards, next_states, dones)
+
+            self.index = (self.index + len(rewards)) % self.capacity
+            self.size = min(self.size + len(rewards), self.capacity)
+            self.pushes += len(rewards)
+
+        return idx
+
+    def state_dict(self, arrays=True):
+        # Copies of the filled part of the arrays and everything else needed to carry on where we are.
+        # Without arrays they are None, for saving them some other way
+        with self.lock:
+            state = {name: getattr(self, name)[:self.size].copy() if arrays else None for name in self.arrays}
+            state.update(index=self.index, size=self.size, rng=self.rng.bit_generator.state)
+
+        return state
+
+    def load_state_dict(self, state):
+        # The arrays may be memory mapped files (and longer than size), they are copied into the buffer
+        with self.lock:
+            size = state['size']
+            for name in self.arrays:
+                getattr(self, name)[:size] = state[name][:size]
+            self.index = state['index']
+            self.size = size
+            self.rng.bit_generator.state = state['rng']
+
+    def sample_indices(self, batch_size):
+        # Without replacement like random.sample, and the whole memory if it is not bigger than the batch
+        if self.size > batch_size:
+            return self.rng.choice(self.size, batch_size, replace=False)
+
+        return np.arange(self.size)
+
+    def sample(self, batch_size):
+        # states, actions, rewards, next_states, dones
+        with self.lock:
+            return self.get(self.sample_indices(batch_size))
+
+    def get(self, idx):
+        # Fancy indexing already makes contiguous copies, the tensors just wrap them
+        return (torch.from_numpy(self.states[idx]),
+                torch.from_numpy(self.actions[idx]),
+                torch.from_numpy(self.rewards[idx]),
+                torch.from_numpy(self.next_states[idx]),
+                torch.from_numpy(self.dones[idx]))
+
+
+class SumTree:
+    # Binary tree in an array where every node is the sum of its two children and the leaves hold the
+    # priorities. Updating and finding leaves is O(log n) and works on a whole batch of indices at once
+
+    def __init__(self, capacity):
+        self.leaves = 1 << max(capacity - 1, 1).bit_length()  # Power of two, so all leaves are on one level
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[np.asarray(idx) + self.leaves]
+
+    def update(self, idx, priorities):
+        pos = np.asarray(idx, dtype=np.int64) + self.leaves
+        if pos.size == 0:
+            return
+        self.tree[pos] = priorities
+
+        # Recompute the parents level by level (instead of adding deltas, so rounding errors don't pile up)
+        pos = np.unique(pos // 2)
+        while True:
+            self.tree[pos] = self.tree[2 * pos] + self.tree[2 * pos + 1]
+            if pos[0] == 1:
+                break
+            pos = np.unique(pos // 2)
+
+    def find(self, values):
+        # Index of the leaf where the running sum of the priorities passes each value. A value on a boundary
+        # or off by rounding never goes into a subtree whose priorities are all zero (like the leaves past the
+        # filled part of a buffer), so the leaf found always has a priority as long as the total isn't zero
+        values = np.array(values, dtype=np.float64)
+        pos = np.ones(len(values), dtype=np.int64)
+        while pos[0] < self.leaves:
+            left = 2 * pos
+            go_right = (values >= self.tree[left]) & (self.tree[left + 1] > 0)
+            values -= np.where(go_right, self.tree[left], 0)
+            pos = np.where(go_right, left + 1, left)
+
+        return pos - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    # Transitions are sampled with probability priority^alpha / sum(priority^alpha), where the priority is
+    # the size of their last TD error. New transitions get the largest priority seen so far, so they are
+    # replayed at least once. sample() also returns the importance sampling weights (annealed from beta to 1)
+    # and the indices to pass to update_priorities
+
+    def __init__(self, capacity, state_size, action_size, alpha=0.6, beta=0.4, beta_increment=0.001, epsilon=1e-3):
+        super().__init__(capacity, state_size, action_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon  # Keeps transitions with a zero TD error in the game
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def push(self, state, action, reward, next_state, done):
+        with self.lock:
+            idx = self.index
+            super().push(state, action, reward, next_state, done)
+            self.tree.update([idx], [self.max_priority ** self.alpha])
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        with self.lock:
+            idx = super().push_batch(states, actions, rewards, next_states, dones)
+            self.tree.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+
+        return idx
+
+    def state_dict(self, arrays=True):
+        with self.lock:
+            state = super().state_dict(arrays)
+            state.update(priorities=self.tree.get(np.arange(self.size)), max_priority=self.max_priority,
+                         beta=self.beta)
+
+        return state
+
+    def load_state_dict(self, state):
+        with self.lock:
+            super().load_state_dict(state)
+            self.tree = SumTree(self.capacity)
+            if self.size:
+                self.tree.update(np.arange(self.size), state['priorities'])
+            self.max_priority = state['max_priority']
+            self.beta = state['beta']
+
+    def sample_indices(self, batch_size):
+        # Stratified: one value in each of batch_size equal slices of the total priority
+        batch_size = min(batch_size, self.size)
+        total = self.tree.total()
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        idx = self.tree.find(np.minimum(values, np.nextafter(total, 0)))
+
+        return np.minimum(idx, self.size - 1)
+
+    def sample(self, batch_size):
+        # states, actions, rewards, next_states, dones, weights, indices
+        with self.lock:
+            idx = self.sample_indices(batch_size)
+
+            probabilities = self.tree.get(idx) / self.tree.total()
+            weights = (self.size * probabilities) ** -self.beta
+            weights /= weights.max()
+            self.beta = min(1.0, self.beta + self.beta_increment)
+
+            return self.get(idx) + (torch.from_numpy(weights.astype(np.float32)), idx)
+
+    def update_priorities(self, idx, td_errors):
+        # With a learner thread the sampled transitions may have been overwritten since, they just get the
+        # priority that was meant for the old ones
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.epsilon
+        with self.lock:
+            self.max_priority = max(self.max_priority, priorities.max(initial=0))
+            self.tree.update(idx, priorities ** self.alpha)
+
+
+class CompactStorage:
+    # Mixin that keeps the transitions bit packed by transition_codec: 13 bytes per transition instead of 165
+    # (two float32 states, an int64 one hot action, the reward and the done flag). Only works for the
+    # states of the game, they are unpacked again when a batch is sampled
+
+    arrays = ('state_codes', 'next_codes', 'rewards', 'flags')
+
+    def allocate_arrays(self):
+        capacity = self.capacity
+        self.state_codes = self.allocate('state_codes', (capacity,), np.uint32)
+        self.next_codes = self.allocate('next_codes', (capacity,), np.uint32)
+        self.rewards = self.allocate('rewards', (capacity,), np.float32)
+        self.flags = self.allocate('flags', (capacity,), np.uint8)
+
+    def write(self, idx, states, actions, rewards, next_states, dones):
+        idx = np.atleast_1d(idx)
+        packed = pack_transitions(states, actions, rewards, next_states, dones)
+        for name, values in zip(self.arrays, packed):
+            getattr(self, name)[idx] = values
+
+    def get(self, idx):
+        return unpack_transitions(self.state_codes[idx], self.next_codes[idx], self.rewards[idx], self.flags[idx],
+                                  self.action_size)
+
+
+class MemmapStorage:
+    # Mixin that keeps the arrays of a replay buffer in .npy files mapped into memory instead of in RAM, so the
+    # capacity is limited by the disk. Only the pages that are written or sampled are loaded, and the OS drops
+    # them again when it needs the memory. The files go to a new folder inside folder and are deleted with
+    # the buffer (or at exit)
+
+    def __init__(self, folder, capacity, state_size, action_size, **kwargs):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = tempfile.mkdtemp(prefix='replay_', dir=folder)
+        self.finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+        super().__init__(capacity, state_size, action_size, **kwargs)
+
+    def allocate(self, name, shape, dtype):
+        # A new file is all zeros without being written, like np.zeros
+        path = os.path.join(self.path, name + '.npy')
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    def save_files(self, paths):
+        # Copies the arrays to the .npy files in paths (array name -> path) without reading them into RAM, and
+        # returns the state_dict() that goes with the copies (with None for the arrays). The files are copied
+        # while transitions keep being pushed, then the rows pushed in the meantime are copied again under the
+        # lock, so all the copies hold the buffer as it is at that moment
+        with self.lock:
+            pushes = self.pushes
+        for name, path in paths.items():
+            array = getattr(self, name)
+            array.flush()
+            shutil.copyfile(array.filename, path)
+
+        with self.lock:
+            written = self.pushes - pushes
+            if written >= self.capacity:
+                rows = [slice(None)]
+            else:
+                # The written rows end at index and may wrap around the end of the buffer
+                start = (self.index - written) % self.capacity
+                rows = [slice(start, min(start + written, self.capacity)),
+                        slice(0, max(start + written - self.capacity, 0))]
+            for name, path in paths.items():
+                copy = np.load(path, mmap_mode='r+')
+                for part in rows:
+                    copy[part] = getattr(self, name)[part]
+                copy.flush()
+                del copy
+
+            return self.state_dict(arrays=False)
+
+    def get(self, idx):
+        # Gathered in file order, so neighbouring samples share the pages read from the disk, then put back in
+        # the order of idx (which the priorities and weights of a sample line up with)
+        idx = np.asarray(idx)
+        order = np.argsort(idx)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        batch = super().get(idx[order])
+
+        return tuple(values[torch.from_numpy(rank)] for values in batch)
+
+    def resident_bytes(self):
+        # How much of the files is in memory right now, from the Rss of their mappings in /proc/self/smaps
+        # (Linux only, None elsewhere)
+        try:
+            with open('/proc/self/smaps') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        total = 0
+        ours = False
+        for line in lines:
+            fields = line.split()
+            if not fields:
+                continue
+            if '-' in fields[0] and not fields[0].endswith(':'):
+                # Header line of a mapping: address range, permissions, offset, device, inode, path
+                ours = len(fields) > 5 and fields[5].startswith(self.path + os.sep)
+            elif ours and fields[0] == 'Rss:':
+                total += int(fields[1]) * 1024
+
+        return total
+
+
+class MemmapReplayBuffer(MemmapStorage, ReplayBuffer):
+    pass
+
+
+class MemmapPrioritizedReplayBuffer(MemmapStorage, PrioritizedReplayBuffer):
+    pass
+
+
+class CompactReplayBuffer(CompactStorage, ReplayBuffer):
+    pass
+
+
+class CompactPrioritizedReplayBuffer(CompactStorage, PrioritizedReplayBuffer):
+    pass
+
+
+class MemmapCompactReplayBuffer(MemmapStorage, CompactStorage, ReplayBuffer):
+    pass
+
+
+class MemmapCompactPrioritizedReplayBuffer(MemmapStorage, CompactStorage, PrioritizedReplayBuffer):
+    pass
+
+
+# (in files, bit packed, prioritized) -> buffer class
+BUFFERS = {
+    (False, False, False): ReplayBuffer,
+    (False, False, True): PrioritizedReplayBuffer,
+    (False, True, False): CompactReplayBuffer,
+    (False, True, True): CompactPrioritizedReplayBuffer,
+    (True, False, False): MemmapReplayBuffer,
+    (True, False, True): MemmapPrioritizedReplayBuffer,
+    (True, True, False): MemmapCompactReplayBuffer,
+    (True, True, True): MemmapCompactPrioritizedReplayBuffer,
+}
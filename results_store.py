@@ -0,0 +1,163 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Consolidated store for the per episode metrics that training writes to pandas_plots. Every series
+# (one metric of one run) lives in a single float64 column (values.npy) at the offset the catalog gives it,
+# so loading is a memory mapped slice per requested series instead of parsing a text file per series.
+#
+# results_store/
+#     values.npy    - all series back to back
+#     catalog.json  - run, metric, offset and length of every series, and the round winners of every run
+
+METRICS = ('hider_rewards', 'seeker_rewards', 'hiders_interaction', 'seekers_interaction')
+TOTALS = 'round_winners'
+DEFAULT_RUN = 'default'  # Run of the files without a suffix (hider_rewards.csv, ...)
+
+
+def parse_file_name(file_name):
+    # 'seeker_rewardsheuristicsfov300.csv' -> ('heuristicsfov300', 'seeker_rewards'), None if it isn't a metric
+    name, ext = os.path.splitext(file_name)
+    if ext != '.csv':
+        return None
+
+    prefix = ''
+    if name.startswith('random_'):
+        prefix, name = 'random', name[len('random_'):]
+
+    for metric in METRICS + (TOTALS,):
+        if name.startswith(metric):
+            run = prefix + name[len(metric):].lstrip('_')
+            return run or DEFAULT_RUN, metric
+
+    return None
+
+
+def read_series(path):
+    # One value per line, no header (what save_to_csv and MetricsWriter write)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0)
+
+    return pd.read_csv(path, header=None).iloc[:, 0].to_numpy(dtype=np.float64)
+
+
+def read_totals(path):
+    # Written by save_dict_to_csv: the keys in the index, the values in column '0'
+    totals = pd.read_csv(path, index_col=0)['0']
+    return {key: int(value) for key, value in totals.items()}
+
+
+def import_csvs(folder='./pandas_plots', path='./results_store'):
+    # Builds the store from every metric CSV in folder, replacing what was in path. Returns the catalog
+    series = {}
+    totals = {}
+    for file_name in sorted(os.listdir(folder)):
+        parsed = parse_file_name(file_name)
+        if parsed is None:
+            continue
+
+        run, metric = parsed
+        if metric == TOTALS:
+            totals[run] = read_totals(os.path.join(folder, file_name))
+        else:
+            series[run, metric] = read_series(os.path.join(folder, file_name))
+
+    return write_store(series, totals, path)
+
+
+def write_store(series, totals, path='./results_store'):
+    # series: (run, metric) -> values of every episode, totals: run -> {'hiders': wins, 'seekers': wins}
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    catalog = {'series': [], 'totals': totals}
+    offset = 0
+    for (run, metric), values in series.items():
+        catalog['series'].append({'run': run, 'metric': metric, 'offset': offset, 'length': len(values)})
+        offset += len(values)
+
+    values = np.concatenate([np.asarray(values, dtype=np.float64) for values in series.values()]) \
+        if series else np.zeros(0)
+
+    # The catalog is replaced last, so a reader never sees offsets into a values file they don't belong to
+    np.save(os.path.join(path, 'values.tmp.npy'), values)
+    os.replace(os.path.join(path, 'values.tmp.npy'), os.path.join(path, 'values.npy'))
+    with open(os.path.join(path, 'catalog.tmp.json'), 'w') as f:
+        json.dump(catalog, f)
+    os.replace(os.path.join(path, 'catalog.tmp.json'), os.path.join(path, 'catalog.json'))
+
+    return catalog
+
+
+class ResultsStore:
+    # Read side of the store. Nothing but the catalog is read up front, series are sliced out of the memory
+    # mapped values when they are asked for
+
+    def __init__(self, path='./results_store'):
+        with open(os.path.join(path, 'catalog.json')) as f:
+            catalog = json.load(f)
+
+        self.values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        self.totals = catalog['totals']
+        self.entries = {(entry['run'], entry['metric']): (entry['offset'], entry['length'])
+                        for entry in catalog['series']}
+
+    def runs(self):
+        return sorted({run for run, _ in self.entries})
+
+    def metrics(self):
+        return sorted({metric for _, metric in self.entries})
+
+    def series(self, run, metric):
+        # Read only view into the memory map, no copy
+        offset, length = self.entries[run, metric]
+        return self.values[offset:offset + length]
+
+    def select(self, runs=None, metrics=None):
+        # Keys of the stored series matching the selection, None selects everything
+        if isinstance(runs, str):
+            runs = [runs]
+        if isinstance(metrics, str):
+            metrics = [metrics]
+
+        return [(run, metric) for run, metric in self.entries
+                if (runs is None or run in runs) and (metrics is None or metric in metrics)]
+
+    def load(self, runs=None, metrics=None):
+        # Tidy frame with one row per run, metric and episode. Only the selected series are read
+        keys = self.select(runs, metrics)
+        lengths = [self.entries[key][1] for key in keys]
+
+        return pd.DataFrame({
+            'run': pd.Categorical(np.repeat([run for run, _ in keys], lengths)),
+            'metric': pd.Categorical(np.repeat([metric for _, metric in keys], lengths)),
+            'episode': np.concatenate([np.arange(length) for length in lengths]) if keys else np.zeros(0, int),
+            'value': np.concatenate([self.series(*key) for key in keys]) if keys else np.zeros(0),
+        })
+
+    def wide(self, metric, runs=None):
+        # One column per run, indexed by episode (runs of different lengths are padded with NaN)
+        return pd.DataFrame({run: pd.Series(self.series(run, metric)) for run, _ in self.select(runs, metric)})
+
+    def rolling(self, metric, window=None, runs=None, agg='mean'):
+        # Rolling aggregate of metric over window episodes for every selected run. Without a window it is the
+        # running aggregate since the first episode (like the mean scores in data_analysis.ipynb)
+        frame = self.wide(metric, runs)
+        windows = frame.expanding() if window is None else frame.rolling(window, min_periods=1)
+
+        return getattr(windows, agg)()
+
+    def round_winners(self, runs=None):
+        # Frame with the hider and seeker wins of every run that has them
+        if isinstance(runs, str):
+            runs = [runs]
+
+        return pd.DataFrame.from_dict({run: totals for run, totals in self.totals.items()
+                                       if runs is None or run in runs}, orient='index')
+
+
+if __name__ == '__main__':
+    catalog = import_csvs()
+    print('Imported {} series of {} runs'.format(len(catalog['series']),
+                                                 len({entry['run'] for entry in catalog['series']})))
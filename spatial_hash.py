@@ -0,0 +1,113 @@
+import pygame
+
+# Uniform grid over the arena for collision and proximity queries. Every sprite is registered in the cells
+# its rect covers, so a query only looks at the sprites in the cells around the queried area instead of
+# every sprite of the group.
+
+
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}  # cell key -> {sprite: None}
+        self.sprite_cells = {}  # sprite -> (first column, first row, last column, last row)
+
+    @staticmethod
+    def cell_keys(span):
+        # One int per cell, cheaper to hash than a (column, row) tuple. Rows stay far below 2**16 in both
+        # directions, even for objects dragged off the screen
+        col0, row0, col1, row1 = span
+        return [(col << 16) + row for col in range(col0, col1 + 1) for row in range(row0, row1 + 1)]
+
+    def cell_span(self, x, y, w, h):
+        # Cells that hold a pixel of the rect, None for an empty rect (those never collide)
+        if w <= 0 or h <= 0:
+            return None
+
+        size = self.cell_size
+        return x // size, y // size, (x + w - 1) // size, (y + h - 1) // size
+
+    def insert(self, sprite):
+        span = self.cell_span(*sprite.rect)
+        self.sprite_cells[sprite] = span
+        if span is None:
+            return
+
+        for key in self.cell_keys(span):
+            self.cells.setdefault(key, {})[sprite] = None
+
+    def remove(self, sprite):
+        span = self.sprite_cells.pop(sprite)
+        if span is None:
+            return
+
+        for key in self.cell_keys(span):
+            cell = self.cells[key]
+            del cell[sprite]
+            if not cell:
+                del self.cells[key]
+
+    def move(self, sprite):
+        # Call after the rect of the sprite changed. Only touches the cells if it crossed a cell border
+        if self.cell_span(*sprite.rect) != self.sprite_cells[sprite]:
+            self.remove(sprite)
+            self.insert(sprite)
+
+    def query(self, x, y, w, h):
+        # Sprites registered in any cell the area overlaps. They are candidates, the caller does the exact test
+        span = self.cell_span(x, y, w, h)
+        if span is None:
+            return set()
+
+        found = set()
+        cells = self.cells
+        for key in self.cell_keys(span):
+            if key in cells:
+                found.update(cells[key])
+
+        return found
+
+
+class IndexedGroup(pygame.sprite.Group):
+    # Sprite group that keeps its members in a SpatialHash. Query results come back in the order the
+    # sprites were added, like iterating over the group
+
+    def __init__(self, cell_size, *sprites):
+        self.index = SpatialHash(cell_size)
+        self.order = {}  # sprite -> sequence number
+        self.sequence = 0
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.order[sprite] = self.sequence
+        self.sequence += 1
+        self.index.insert(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        del self.order[sprite]
+        self.index.remove(sprite)
+
+    def moved(self, sprite):
+        if sprite in self.order:
+            self.index.move(sprite)
+
+    def candidates(self, rect, margin=0):
+        x, y, w, h = rect
+        found = self.index.query(x - margin, y - margin, w + 2 * margin, h + 2 * margin)
+
+        return sorted(found, key=self.order.__getitem__)
+
+    def colliding(self, rect):
+        # Members whose rect collides with rect, like pygame.sprite.collide_rect on every member
+        return [sprite for sprite in self.candidates(rect) if sprite.rect.colliderect(rect)]
+
+    def collides(self, rect):
+        # Same as colliding(rect) being non empty, without sorting the candidates
+        x, y, w, h = rect
+        return any(sprite.rect.colliderect(rect) for sprite in self.index.query(x, y, w, h))
+
+    def near(self, player, distance, test):
+        # Members passing test(player, sprite), for tests that need the edges of both within distance pixels.
+        # The edge midpoints (midright, midbottom) lie one pixel outside a rect, hence the extra pixel
+        return [sprite for sprite in self.candidates(player.rect, distance + 1) if test(player, sprite)]
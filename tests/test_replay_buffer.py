@@ -0,0 +1,88 @@
+import threading
+import numpy as np
+import torch
+from replay_buffer import PrioritizedReplayBuffer, CompactPrioritizedReplayBuffer, MemmapReplayBuffer, \
+    MemmapPrioritizedReplayBuffer
+from checkpoint import CheckpointManager, load_snapshot
+
+
+def transitions(n, rng):
+    states = rng.integers(0, 2, (n, 15)).astype(np.float32)
+    actions = np.eye(5, dtype=np.int64)[rng.integers(0, 5, n)]
+    return states, actions, rng.random(n).astype(np.float32), states, rng.random(n) < 0.1
+
+
+def test_prioritized_empty_updates():
+    # Zero transitions or priorities at once are no-ops, not an IndexError in the sum tree
+    rng = np.random.default_rng(0)
+    for buffer_class in (PrioritizedReplayBuffer, CompactPrioritizedReplayBuffer):
+        memory = buffer_class(100, 15, 5)
+        memory.push_batch(*transitions(0, rng))
+        memory.update_priorities(np.zeros(0, dtype=np.int64), np.zeros(0))
+        assert len(memory) == 0 and memory.tree.total() == 0
+
+        memory.push_batch(*transitions(10, rng))
+        memory.push_batch(*transitions(0, rng))
+        memory.update_priorities([], [])
+        assert len(memory) == 10 and memory.tree.total() > 0
+
+
+def numbered(first, n):
+    # Transitions whose states, reward, action and done flag all tell which push they came from
+    ids = np.arange(first, first + n)
+    states = np.repeat(ids[:, None], 15, axis=1).astype(np.float32)
+    return states, np.eye(5, dtype=np.int64)[ids % 5], ids.astype(np.float32), states + 0.5, ids % 2 == 0
+
+
+class Holder:
+    # What save_snapshot needs of an Agent
+    def __init__(self, memory):
+        self.memory = memory
+        self.model = torch.nn.Linear(2, 2)
+        self.trainer = Holder.__new__(Holder)
+        self.trainer.optimizer = torch.optim.Adam(self.model.parameters())
+
+
+def test_memmap_snapshot_while_pushing(tmp_path):
+    # The snapshot files are copied while another thread keeps pushing, still every row of the snapshot has to
+    # be one whole transition and index, size and priorities have to go with them
+    for buffer_class in (MemmapReplayBuffer, MemmapPrioritizedReplayBuffer):
+        memory = buffer_class(str(tmp_path / 'replay'), 300_000, 15, 5)
+        memory.push_batch(*numbered(0, 250_000))
+        done = threading.Event()
+        pushed = []
+
+        def push():
+            first = 250_000
+            while not done.is_set() and first < 4_000_000:  # Ids stay exact in float32
+                memory.push_batch(*numbered(first, 1000))
+                first += 1000
+            pushed.append(first)
+
+        pusher = threading.Thread(target=push)
+        pusher.start()
+        checkpoints = CheckpointManager('_t', folder=str(tmp_path / 'model'),
+                                        snapshot_folder=str(tmp_path / buffer_class.__name__))
+        checkpoints.save_snapshot(1, {'a': Holder(memory)}, {})
+        checkpoints.flush()
+        done.set()
+        pusher.join()
+        checkpoints.close()
+
+        state = load_snapshot('_t', str(tmp_path / buffer_class.__name__))['agents']['a']['memory']
+        size, index = state['size'], state['index']
+        ids = state['rewards'][:size]
+        assert pushed[0] > 250_000, 'nothing was pushed during the snapshot'
+        assert np.array_equal(state['states'][:size], np.repeat(ids[:, None], 15, axis=1))
+        assert np.array_equal(state['next_states'][:size], state['states'][:size] + 0.5)
+        assert np.array_equal(state['actions'][:size].argmax(axis=1), ids % 5)
+        assert np.array_equal(state['dones'][:size], ids % 2 == 0)
+        # Every push up to the saved index is there once, the newest right before index
+        newest = ids[(index - 1) % memory.capacity]
+        assert np.array_equal(np.sort(ids), np.arange(newest + 1 - size, newest + 1))
+        if 'priorities' in state:
+            assert len(state['priorities']) == size
+
+        restored = buffer_class(str(tmp_path / 'restored'), 300_000, 15, 5)
+        restored.load_state_dict(state)
+        assert len(restored) == size and restored.index == index
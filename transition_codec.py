@@ -0,0 +1,68 @@
+import numpy as np
+import torch
+from hide_seek import OBS_DIRECTION, OBS_GRABBED, OBS_FOV, STATE_SIZE, FOV_lines_number
+
+# Bit packing of the transitions in the replay memory. A state is a one hot direction, a grab bit and ten
+# rays with codes 0..5, so it fits in 33 bits:
+#
+#   state code (uint32)  bits 0-1: direction, bits 2-31: ray i in bits 2 + 3i .. 4 + 3i
+#   flags (uint8)        bit 0: grab bit of the state, bit 1: grab bit of the next state, bit 2: done,
+#                        bits 3-5: action
+#
+# The grab bits don't fit next to the rays, they go into the flags byte with the action and the done flag.
+# With the float32 reward a transition takes 4 + 4 + 1 + 4 = 13 bytes
+
+RAY_BITS = 3
+RAY_SHIFTS = 2 + RAY_BITS * np.arange(FOV_lines_number, dtype=np.uint32)
+N_DIRECTIONS = OBS_DIRECTION.stop - OBS_DIRECTION.start
+
+GRABBED = 1
+NEXT_GRABBED = 2
+DONE = 4
+ACTION_SHIFT = 3
+
+
+def pack_states(states):
+    # (n, 15) states of any numeric type -> (n,) uint32 codes and (n,) grab bits
+    states = np.asarray(states).reshape(-1, STATE_SIZE)
+    rays = states[:, OBS_FOV].astype(np.uint32)
+    codes = np.argmax(states[:, OBS_DIRECTION], axis=1).astype(np.uint32)
+    codes |= np.bitwise_or.reduce(rays << RAY_SHIFTS, axis=1)
+
+    return codes, states[:, OBS_GRABBED] != 0
+
+
+def unpack_states(codes, grabbed):
+    # Inverse of pack_states, as one float32 array
+    codes = np.asarray(codes, dtype=np.uint32)
+    states = np.zeros((len(codes), STATE_SIZE), dtype=np.float32)
+    states[np.arange(len(codes)), OBS_DIRECTION.start + (codes & (N_DIRECTIONS - 1))] = 1
+    states[:, OBS_GRABBED] = grabbed
+    states[:, OBS_FOV] = (codes[:, None] >> RAY_SHIFTS) & ((1 << RAY_BITS) - 1)
+
+    return states
+
+
+def pack_transitions(states, actions, rewards, next_states, dones):
+    # Actions are one hot like in Agent.memory. Returns state codes, next state codes, rewards and flags
+    state_codes, grabbed = pack_states(states)
+    next_codes, next_grabbed = pack_states(next_states)
+    actions = np.argmax(np.asarray(actions).reshape(len(state_codes), -1), axis=1)
+
+    flags = (grabbed * GRABBED | next_grabbed * NEXT_GRABBED | np.asarray(dones).reshape(-1) * DONE
+             | actions << ACTION_SHIFT).astype(np.uint8)
+
+    return state_codes, next_codes, np.asarray(rewards, dtype=np.float32).reshape(-1), flags
+
+
+def unpack_transitions(state_codes, next_codes, rewards, flags, action_size=5):
+    # Batch ready for QTrainer.train_step: states, one hot actions, rewards, next states, dones as tensors
+    flags = np.asarray(flags)
+    actions = np.zeros((len(flags), action_size), dtype=np.int64)
+    actions[np.arange(len(flags)), flags >> ACTION_SHIFT] = 1
+
+    return (torch.from_numpy(unpack_states(state_codes, flags & GRABBED)),
+            torch.from_numpy(actions),
+            torch.from_numpy(np.asarray(rewards, dtype=np.float32)),
+            torch.from_numpy(unpack_states(next_codes, flags & NEXT_GRABBED != 0)),
+            torch.from_numpy(flags & DONE != 0))
@@ -0,0 +1,270 @@
+import numpy as np
+
+from hide_seek import Game, fov_rays, fov_codes_from_rays, direction_move_map, opposite_move_map, \
+    WINDOW_W, WINDOW_H, block_size, FOV_lines_number, STATE_SIZE, OBS_GRABBED, OBS_FOV, \
+    WALL_FOV, CRATE_FOV, HAMMER_FOV, HIDER_FOV, SEEKER_FOV
+
+# N independent hide and seek games stepped in lockstep. Same rules as Game.tick, but the state of all
+# games is kept in NumPy arrays (struct of arrays) so one step call advances every arena at once.
+
+# Player slots, in the order Game.tick takes the actions
+HIDER_A, HIDER_B, SEEKER_A, SEEKER_B = 0, 1, 2, 3
+N_PLAYERS = 4
+
+# Round winners
+NO_WINNER, HIDERS_WON, SEEKERS_WON = 0, 1, 2
+winner_names = {NO_WINNER: None, HIDERS_WON: 'hiders', SEEKERS_WON: 'seekers'}
+
+GRAB_RELEASE_ACTION = 4  # Index of the 1 in [0, 0, 0, 0, 1]
+
+
+def collide(ax, ay, aw, ah, bx, by, bw, bh):
+    # pygame.sprite.collide_rect for rects with a positive size
+    return (ax < bx + bw) & (ay < by + bh) & (ax + aw > bx) & (ay + ah > by)
+
+
+def grab_proximity(px, py, pw, ph, ox, oy, ow, oh):
+    # Game.check_grab_proximity on arrays
+    return ((np.abs(ox - (px + pw)) <= 15) & (np.abs((oy + oh // 2) - (py + ph // 2)) <= 15)) | \
+           ((np.abs((ox + ow) - px) <= 15) & (np.abs((oy + oh // 2) - (py + ph // 2)) <= 15)) | \
+           ((np.abs((ox + ow // 2) - (px + pw // 2)) <= 15) & (np.abs(oy - (py + ph)) <= 15)) | \
+           ((np.abs((ox + ow // 2) - (px + pw // 2)) <= 15) & (np.abs((oy + oh) - py) <= 15))
+
+
+class VecGame:
+    def __init__(self, n_games, situated=False):
+        self.n_games = n_games
+        self.situated = situated
+        self.arange = np.arange(n_games)
+
+        # Take the layout of the arena from a headless Game, so both always start the same way
+        template = Game(render=False)
+        players = [template.hider_a, template.hider_b, template.seeker_a, template.seeker_b]
+        crates, hammers, walls = template.crates_group.sprites(), template.hammers_group.sprites(), \
+            template.walls_group.sprites()
+
+        self.spawn_pos = np.array([[p.rect.x, p.rect.y] for p in players], dtype=np.int64)
+        self.spawn_direction = np.array([p.direction for p in players], dtype=np.int64)
+        self.player_size = np.array([[p.rect.w, p.rect.h] for p in players], dtype=np.int64)
+
+        self.spawn_crate_pos = np.array([[c.rect.x, c.rect.y] for c in crates], dtype=np.int64)
+        self.crate_size = np.array([[c.rect.w, c.rect.h] for c in crates], dtype=np.int64)
+        self.spawn_hammer_pos = np.array([[h.rect.x, h.rect.y] for h in hammers], dtype=np.int64)
+        self.hammer_size = np.array([[h.rect.w, h.rect.h] for h in hammers], dtype=np.int64)
+        self.wall_rects = np.array([tuple(w.rect) for w in walls], dtype=np.int64)
+
+        # Displacement of actions 1..4 (index 0 is unused), non situated and situated
+        situated_move_map = template.hider_a.situated_move_map
+        self.moves = np.array([(0, 0)] + [direction_move_map[a] for a in range(1, 5)], dtype=np.int64)
+        self.situated_moves = np.array([(0, 0)] + [situated_move_map[a] for a in range(1, 5)], dtype=np.int64)
+        self.opposite = np.array([0] + [opposite_move_map[a] for a in range(1, 5)], dtype=np.int64)
+
+        # Everything a ray can hit, in the order of Game.fov_groups
+        self.fov_object_codes = np.array([WALL_FOV] * len(walls) + [CRATE_FOV] * len(crates) +
+                                         [HAMMER_FOV] * len(hammers) + [HIDER_FOV] * 2 + [SEEKER_FOV] * 2)
+
+        # State of every arena
+        n = n_games
+        self.counter = np.zeros(n)
+        self.pos = np.zeros((n, N_PLAYERS, 2), dtype=np.int64)
+        self.direction = np.zeros((n, N_PLAYERS), dtype=np.int64)
+        self.grabbed = np.zeros((n, N_PLAYERS), dtype=bool)
+        self.grabbed_obj = np.zeros((n, N_PLAYERS), dtype=np.int64)  # Crate for hiders, hammer for seekers
+        self.interaction_times = np.zeros((n, N_PLAYERS), dtype=np.int64)
+        self.fov = np.zeros((n, N_PLAYERS, FOV_lines_number), dtype=np.int8)
+        self.hider_alive = np.zeros((n, 2), dtype=bool)
+        self.crate_pos = np.zeros((n, len(crates), 2), dtype=np.int64)
+        self.hammer_pos = np.zeros((n, len(hammers), 2), dtype=np.int64)
+        self.hammer_alive = np.zeros((n, len(hammers)), dtype=bool)
+        self.wall_alive = np.zeros((n, len(walls)), dtype=bool)
+
+        # Terminal observations and interaction counts of the games that ended in the last step
+        self.final_obs = np.zeros((n, N_PLAYERS, STATE_SIZE), dtype=np.int8)
+        self.final_interaction_times = np.zeros((n, N_PLAYERS), dtype=np.int64)
+
+        self.reset()
+
+    def reset(self, mask=None):
+        # Reset all games, or only the ones selected by the boolean mask
+        if mask is None:
+            mask = np.ones(self.n_games, dtype=bool)
+
+        self.counter[mask] = 60
+        self.pos[mask] = self.spawn_pos
+        self.direction[mask] = self.spawn_direction
+        self.grabbed[mask] = False
+        self.grabbed_obj[mask] = 0
+        self.interaction_times[mask] = 0
+        self.fov[mask] = 0
+        self.hider_alive[mask] = True
+        self.crate_pos[mask] = self.spawn_crate_pos
+        self.hammer_pos[mask] = self.spawn_hammer_pos
+        self.hammer_alive[mask] = True
+        self.wall_alive[mask] = True
+
+        return self.get_obs()
+
+    def step(self, actions):
+        # actions: (n_games, 4) index of the 1 in each player's one hot action, players ordered like Game.tick
+        # Returns observations (n_games, 4, STATE_SIZE), rewards (n_games, 4), dones and winners (n_games,).
+        # Finished games are reset right away, their last observation is kept in final_obs
+        actions = np.asarray(actions, dtype=np.int64) + 1
+
+        self.counter -= 0.10
+
+        # Perform passed action, hiders and seekers
+        everywhere = np.ones(self.n_games, dtype=bool)
+        for player in (HIDER_A, HIDER_B):
+            self.act(player, actions[:, player], everywhere)
+
+        # Only move the seekers if the 10 seconds have passed
+        seekers_active = self.counter <= 50
+        for player in (SEEKER_A, SEEKER_B):
+            self.act(player, actions[:, player], seekers_active)
+
+        self.update_fov()
+
+        # Hiders win the tick unless a seeker sees one, nobody gets rewards in the preliminary stage
+        seen = (self.fov[:, [SEEKER_A, SEEKER_B]] == HIDER_FOV).any(axis=(1, 2))
+        reward_hiders = np.where(seen, -1, 1)
+        reward_hiders[self.counter > 50] = 0
+        rewards = np.stack([reward_hiders, reward_hiders, -reward_hiders, -reward_hiders], axis=1)
+
+        self.check_player_collisions()
+        self.check_hammer_wall_collisions()
+
+        # Check Game over
+        winners = np.full(self.n_games, NO_WINNER, dtype=np.int8)
+        winners[self.counter <= 0] = HIDERS_WON
+        winners[~self.hider_alive.any(axis=1)] = SEEKERS_WON
+        dones = winners != NO_WINNER
+
+        obs = self.get_obs()
+        if dones.any():
+            self.final_obs[dones] = obs[dones]
+            self.final_interaction_times[dones] = self.interaction_times[dones]
+            obs[dones] = self.reset(dones)[dones]
+
+        return obs, rewards, dones, winners
+
+    def get_obs(self):
+        obs = np.zeros((self.n_games, N_PLAYERS, STATE_SIZE), dtype=np.int8)
+        np.put_along_axis(obs, (self.direction - 1)[..., None], 1, axis=2)
+        obs[..., OBS_GRABBED] = self.grabbed
+        obs[..., OBS_FOV] = self.fov
+
+        return obs
+
+    def act(self, player, action, active):
+        # Move or grab/release for one player slot in the games where active is set
+        moving = active & (action <= 4)
+        self.move(player, action, moving)
+
+        collided = moving & (self.check_unit_wall_collision(player) | self.check_unit_crate_collision(player))
+        self.move(player, self.opposite[np.where(collided, action, 1)], collided, moved_back=True)
+
+        grabbing = active & (action > 4)
+        if grabbing.any():
+            if player in (HIDER_A, HIDER_B):
+                self.hider_grab(player, grabbing)
+            else:
+                self.seeker_grab(player, grabbing)
+
+    def move(self, player, action, mask, moved_back=False):
+        moves = self.situated_moves if self.situated else self.moves
+        delta = np.where(mask[:, None], moves[np.where(mask, action, 0)], 0)
+        if not moved_back:
+            self.direction[mask, player] = action[mask]
+
+        # Move the player and make sure it stays inside the screen
+        pos = self.pos[:, player]
+        pos += delta
+        np.clip(pos[:, 0], 0, WINDOW_W - block_size, out=pos[:, 0])
+        np.clip(pos[:, 1], 0, WINDOW_H - block_size, out=pos[:, 1])
+
+        # Move the grabbed object along, it is not kept inside the screen
+        obj_pos = self.crate_pos if player in (HIDER_A, HIDER_B) else self.hammer_pos
+        carrying = mask & self.grabbed[:, player]
+        obj_pos[self.arange, self.grabbed_obj[:, player]] += np.where(carrying[:, None], delta, 0)
+
+    def hider_grab(self, player, mask):
+        # Hiders take hammers out of the game and grab/release crates, in group order
+        for idx in range(self.hammer_pos.shape[1]):
+            near = mask & self.hammer_alive[:, idx] & self.near(player, self.hammer_pos[:, idx], self.hammer_size[idx])
+            self.interaction_times[near, player] += 1
+            self.hammer_alive[near, idx] = False
+
+        for idx in range(self.crate_pos.shape[1]):
+            near = mask & self.near(player, self.crate_pos[:, idx], self.crate_size[idx])
+            self.toggle_grab(player, idx, near)
+
+    def seeker_grab(self, player, mask):
+        # Seekers grab/release the hammers that are still in the game
+        for idx in range(self.hammer_pos.shape[1]):
+            near = mask & self.hammer_alive[:, idx] & self.near(player, self.hammer_pos[:, idx], self.hammer_size[idx])
+            self.toggle_grab(player, idx, near)
+
+    def toggle_grab(self, player, idx, near):
+        # Invert the boolean (True -> False, False -> True)
+        grab = near & ~self.grabbed[:, player]
+        self.grabbed_obj[grab, player] = idx
+        self.grabbed[near, player] = grab[near]
+        self.interaction_times[near, player] += 1
+
+    def near(self, player, obj_pos, obj_size):
+        pos, size = self.pos[:, player], self.player_size[player]
+        return grab_proximity(pos[:, 0], pos[:, 1], size[0], size[1],
+                              obj_pos[:, 0], obj_pos[:, 1], obj_size[0], obj_size[1])
+
+    def check_unit_wall_collision(self, player):
+        pos, size = self.pos[:, player], self.player_size[player]
+        hit = collide(pos[:, 0, None], pos[:, 1, None], size[0], size[1],
+                      self.wall_rects[:, 0], self.wall_rects[:, 1], self.wall_rects[:, 2], self.wall_rects[:, 3])
+
+        return (hit & self.wall_alive).any(axis=1)
+
+    def check_unit_crate_collision(self, player):
+        pos, size = self.pos[:, player], self.player_size[player]
+        hit = collide(pos[:, 0, None], pos[:, 1, None], size[0], size[1],
+                      self.crate_pos[..., 0], self.crate_pos[..., 1], self.crate_size[:, 0], self.crate_size[:, 1])
+
+        return hit.any(axis=1)
+
+    def check_player_collisions(self):
+        # Remove caught hiders
+        for hider in (HIDER_A, HIDER_B):
+            for seeker in (SEEKER_A, SEEKER_B):
+                hider_pos, hider_size = self.pos[:, hider], self.player_size[hider]
+                seeker_pos, seeker_size = self.pos[:, seeker], self.player_size[seeker]
+                caught = collide(hider_pos[:, 0], hider_pos[:, 1], hider_size[0], hider_size[1],
+                                 seeker_pos[:, 0], seeker_pos[:, 1], seeker_size[0], seeker_size[1])
+                self.hider_alive[caught, hider] = False
+
+    def check_hammer_wall_collisions(self):
+        # Remove the walls hit by a hammer that is still in the game
+        hit = collide(self.hammer_pos[:, :, None, 0], self.hammer_pos[:, :, None, 1],
+                      self.hammer_size[:, None, 0], self.hammer_size[:, None, 1],
+                      self.wall_rects[:, 0], self.wall_rects[:, 1], self.wall_rects[:, 2], self.wall_rects[:, 3])
+        self.wall_alive &= ~(hit & self.hammer_alive[:, :, None]).any(axis=1)
+
+    def update_fov(self):
+        # Cast the rays of all players of all games in one call
+        crates = np.concatenate([self.crate_pos, np.broadcast_to(self.crate_size, self.crate_pos.shape)], axis=2)
+        hammers = np.concatenate([self.hammer_pos, np.broadcast_to(self.hammer_size, self.hammer_pos.shape)], axis=2)
+        players = np.concatenate([self.pos, np.broadcast_to(self.player_size, self.pos.shape)], axis=2)
+        walls = np.broadcast_to(self.wall_rects, (self.n_games,) + self.wall_rects.shape)
+        obj_rects = np.concatenate([walls, crates, hammers, players], axis=1)
+
+        seekers_alive = np.ones((self.n_games, 2), dtype=bool)
+        crates_valid = np.ones(self.crate_pos.shape[:2], dtype=bool)
+        obj_valid = np.concatenate([self.wall_alive, crates_valid, self.hammer_alive,
+                                    self.hider_alive, seekers_alive], axis=1)
+
+        rays = fov_rays(self.pos[..., 0], self.pos[..., 1], self.player_size[:, 0], self.player_size[:, 1],
+                        self.direction)
+        fov = fov_codes_from_rays(rays, self.direction, obj_rects[:, None], self.fov_object_codes,
+                                  obj_valid[:, None])
+
+        # Caught hiders keep their last FOV
+        looking = np.concatenate([self.hider_alive, seekers_alive], axis=1)
+        self.fov = np.where(looking[..., None], fov, self.fov).astype(np.int8)